@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""Size/CPU tradeoff of payload compression.
+
+For a few typical payloads (config blob, register array, template text) of
+growing size, prints the encoded size with every available codec, the
+compression ratio and the time to compress and decompress one message.
+
+    PYTHONPATH=. python3 benchmarks/compression.py [-n ITERATIONS]
+
+"""
+
+import argparse
+import functools
+import json
+import random
+import time
+
+from mqttrpc.wire import available_compressions, compress, decompress, dumps
+
+
+def config_blob(size):
+    random.seed(size)
+    devices = []
+    while len(json.dumps(devices)) < size:
+        devices.append(
+            {
+                "slave_id": random.randint(1, 247),
+                "device_type": random.choice(["WB-MR6C", "WB-MSW v.3", "WB-MAP12E"]),
+                "poll_interval": random.choice([20, 50, 100]),
+                "enabled": True,
+                "channels": [{"name": f"K{i}", "enabled": True} for i in range(6)],
+            }
+        )
+    return {"params": {"path": "/etc/wb-mqtt-serial.conf", "config": devices}, "id": 1}
+
+
+def register_array(size):
+    random.seed(size)
+    values = []
+    while len(json.dumps(values)) < size:
+        values.append(random.randint(0, 65535))
+    return {"result": values, "id": 1}
+
+
+def template_text(size):
+    words = ["register", "address", "format", "u16", "scale", "channel", "readonly", "title"]
+    random.seed(size)
+    text = ""
+    while len(text) < size:
+        text += " ".join(random.choice(words) for _ in range(12)) + "\n"
+    return {"result": text, "id": 1}
+
+
+PAYLOADS = [("config", config_blob), ("registers", register_array), ("template", template_text)]
+SIZES = [256, 1024, 4096, 16384, 65536]
+
+
+def timed(fn, iterations):
+    started = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - started) / iterations
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument("-n", "--iterations", type=int, default=200, help="Iterations per measurement")
+    args = parser.parse_args()
+
+    print(f"{'payload':10} {'raw':>7} {'codec':6} {'size':>7} {'ratio':>6} {'comp us':>8} {'decomp us':>9}")
+    for name, factory in PAYLOADS:
+        for size in SIZES:
+            data = dumps(factory(size)).encode("utf-8")
+            for codec in available_compressions():
+                compressed = compress(data, codec)
+                compress_time = timed(functools.partial(compress, data, codec), args.iterations)
+                decompress_time = timed(functools.partial(decompress, compressed), args.iterations)
+                print(
+                    f"{name:10} {len(data):7} {codec:6} {len(compressed):7} "
+                    f"{len(data) / len(compressed):6.2f} "
+                    f"{compress_time * 1e6:8.1f} {decompress_time * 1e6:9.1f}"
+                )
+
+
+if __name__ == "__main__":
+    main()
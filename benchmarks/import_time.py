@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""Measure import time of mqttrpc entry points.
+
+Every import is timed in a fresh interpreter, so module caches don't hide
+the cost. Also reports whether jsonrpc got loaded, since keeping it out of
+client-only imports is what makes them cheap.
+
+    python3 benchmarks/import_time.py [-n RUNS]
+
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+STATEMENTS = [
+    "import mqttrpc",
+    "import mqttrpc.client",
+    "from mqttrpc import TMQTTRPCClient",
+    "from mqttrpc import MQTTRPCResponseManager",
+]
+
+PROBE = """
+import sys, time
+started = time.perf_counter()
+{statement}
+print(time.perf_counter() - started, "jsonrpc" in sys.modules)
+"""
+
+
+def measure(statement, runs):
+    env = dict(os.environ)
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [root, env.get("PYTHONPATH")]))
+
+    timings = []
+    jsonrpc_loaded = False
+    for _ in range(runs):
+        output = subprocess.check_output(
+            [sys.executable, "-c", PROBE.format(statement=statement)], env=env, text=True
+        )
+        elapsed, loaded = output.split()
+        timings.append(float(elapsed))
+        jsonrpc_loaded = loaded == "True"
+    return statistics.median(timings), jsonrpc_loaded
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument("-n", "--runs", type=int, default=10, help="Interpreter runs per statement")
+    args = parser.parse_args()
+
+    for statement in STATEMENTS:
+        median, jsonrpc_loaded = measure(statement, args.runs)
+        print(f"{statement:45} {median * 1000:8.1f} ms   jsonrpc loaded: {jsonrpc_loaded}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+"""TMQTTRPCPublisher benchmark.
+
+rpc: RPC calls per second over the loopback broker, with the client
+publishing directly and through TMQTTRPCPublisher (wrapper overhead).
+
+slow-link: one producer publishes as fast as it can to a local TCP sink
+reading at a limited rate, through a small socket buffer. Prints the peak
+number of unconfirmed messages kept in memory by paho, the time the
+producer was busy and the time until everything was delivered.
+
+inflight: QoS 1 messages per second through TMQTTRPCPublisher to a local
+TCP broker stand-in acknowledging every message after a given round trip
+time, with paho default in-flight window (20) and with max_inflight set
+to the publisher limit.
+
+    PYTHONPATH=. python3 benchmarks/publisher.py [rpc|slow-link|inflight]
+
+"""
+
+import argparse
+import queue
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import paho.mqtt.client as mqtt
+
+from mqttrpc import MQTTRPCResponseManager
+from mqttrpc.client import TMQTTRPCClient
+from mqttrpc.dispatcher import Dispatcher
+from mqttrpc.loopback import LoopbackBroker
+from mqttrpc.transport import TMQTTRPCPublisher
+
+PAYLOAD = b'{"result": [1, 2, 3, 4, 5, 6, 7, 8], "error": null, "id": 1}'
+SOCKET_BUFFER = 16384
+DEFAULT_COUNTS = {"rpc": 20000, "slow-link": 20000, "inflight": 5000}
+
+
+def bench_rpc(calls, concurrency, wrapped):
+    broker = LoopbackBroker()
+    dispatcher = Dispatcher()
+    dispatcher[("bench", "echo")] = lambda value: value
+
+    server = broker.client("server")
+    server_publisher = TMQTTRPCPublisher(server) if wrapped else server
+
+    def on_message(mosq, obj, msg):  # pylint: disable=unused-argument
+        parts = msg.topic.split("/")
+        response = MQTTRPCResponseManager.handle(msg.payload, parts[4], parts[5], dispatcher)
+        server_publisher.publish(f"{msg.topic}/reply", response.payload)
+
+    server.on_message = on_message
+    server.subscribe("/rpc/v1/bench/+/+/+")
+    server.loop_start()
+
+    client = broker.client("client")
+    rpc_client = TMQTTRPCClient(TMQTTRPCPublisher(client) if wrapped else client)
+    client.on_message = rpc_client.on_mqtt_message
+    client.loop_start()
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as executor:
+        list(
+            executor.map(lambda i: rpc_client.call("bench", "bench", "echo", {"value": i}, 10), range(calls))
+        )
+    elapsed = time.perf_counter() - started
+
+    client.disconnect()
+    server.disconnect()
+    return calls / elapsed
+
+
+def serve_slowly(listener, rate, received):
+    connection, _ = listener.accept()
+    connection.recv(1024)
+    connection.sendall(b"\x20\x02\x00\x00")  # CONNACK
+    chunk = max(1, rate // 100)
+    while True:
+        data = connection.recv(chunk)
+        if not data:
+            return
+        received[0] += len(data)
+        time.sleep(len(data) / rate)
+
+
+def bench_slow_link(messages, rate, wrapped, max_pending):  # pylint: disable=too-many-locals
+    listener = socket.socket()
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, SOCKET_BUFFER)
+    listener.bind(("127.0.0.1", 0))
+    listener.listen(1)
+    received = [0]
+    threading.Thread(target=serve_slowly, args=(listener, rate, received), daemon=True).start()
+
+    client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, "bench")
+    counters = {"published": 0, "confirmed": 0, "peak": 0}
+
+    def on_publish(*args):  # pylint: disable=unused-argument
+        counters["confirmed"] += 1
+
+    client.on_publish = on_publish
+    publisher = TMQTTRPCPublisher(client, max_pending=max_pending) if wrapped else client
+    client.connect(*listener.getsockname())
+    client.socket().setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SOCKET_BUFFER)
+    client.loop_start()
+    time.sleep(0.2)
+    connected_bytes = received[0]
+
+    size = len(PAYLOAD) + len("/rpc/v1/d/s/m/c/reply") + 4
+    started = time.perf_counter()
+    for _ in range(messages):
+        publisher.publish("/rpc/v1/d/s/m/c/reply", PAYLOAD)
+        counters["published"] += 1
+        counters["peak"] = max(counters["peak"], counters["published"] - counters["confirmed"])
+    produced = time.perf_counter() - started
+    while received[0] - connected_bytes < messages * size:
+        time.sleep(0.005)
+    delivered = time.perf_counter() - started
+
+    client.loop_stop()
+    client.disconnect()
+    listener.close()
+    return counters["peak"], produced, delivered
+
+
+def send_acks(connection, acks):
+    while True:
+        due, packet = acks.get()
+        if packet is None:
+            return
+        delay = due - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        connection.sendall(packet)
+
+
+def serve_acks(listener, rtt):
+    """Minimal MQTT broker: accepts one client, acknowledges QoS 1 messages after rtt"""
+    connection, _ = listener.accept()
+    connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    acks = queue.SimpleQueue()
+    threading.Thread(target=send_acks, args=(connection, acks), daemon=True).start()
+
+    buffer = bytearray()
+    while True:
+        data = connection.recv(65536)
+        if not data:
+            acks.put((0, None))
+            return
+        buffer += data
+        while True:
+            # fixed header: packet type and flags, remaining length (variable byte integer)
+            length, multiplier, pos = 0, 1, 1
+            while pos < len(buffer):
+                length += (buffer[pos] & 0x7F) * multiplier
+                multiplier *= 128
+                pos += 1
+                if not buffer[pos - 1] & 0x80:
+                    break
+            else:
+                break
+            if len(buffer) < pos + length:
+                break
+            header, body = buffer[0], bytes(buffer[pos : pos + length])
+            del buffer[: pos + length]
+
+            if header >> 4 == 1:  # CONNECT
+                connection.sendall(b"\x20\x02\x00\x00")
+            elif header >> 4 == 3 and header & 0x06 == 0x02:  # PUBLISH, QoS 1
+                topic_end = 2 + int.from_bytes(body[:2], "big")
+                acks.put((time.monotonic() + rtt, b"\x40\x02" + body[topic_end : topic_end + 2]))
+            elif header >> 4 == 12:  # PINGREQ
+                acks.put((0, b"\xd0\x00"))
+
+
+def bench_inflight(messages, rtt, max_pending, max_inflight):
+    listener = socket.socket()
+    listener.bind(("127.0.0.1", 0))
+    listener.listen(1)
+    threading.Thread(target=serve_acks, args=(listener, rtt), daemon=True).start()
+
+    client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, "bench")
+    connected = threading.Event()
+    client.on_connect = lambda *args: connected.set()
+    publisher = TMQTTRPCPublisher(client, max_pending=max_pending, max_inflight=max_inflight, qos=1)
+    client.connect(*listener.getsockname())
+    client.loop_start()
+    connected.wait(5)
+
+    started = time.perf_counter()
+    for _ in range(messages):
+        publisher.publish("/rpc/v1/d/s/m/c/reply", PAYLOAD)
+    publisher.wait_for_drain()
+    elapsed = time.perf_counter() - started
+
+    client.loop_stop()
+    client.disconnect()
+    listener.close()
+    return messages / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument("mode", choices=["rpc", "slow-link", "inflight"], nargs="?", default="rpc")
+    parser.add_argument("-n", "--count", type=int, help="Number of calls or messages")
+    parser.add_argument("-c", "--concurrency", type=int, default=16, help="Concurrent calls (rpc)")
+    parser.add_argument("-r", "--rate", type=int, default=1000000, help="Sink rate, bytes/s (slow-link)")
+    parser.add_argument("--rtt", type=float, default=0.02, help="Round trip time, s (inflight)")
+    parser.add_argument("--max-pending", type=int, default=1000, help="Publisher limit (slow-link, inflight)")
+    args = parser.parse_args()
+    count = args.count or DEFAULT_COUNTS[args.mode]
+
+    if args.mode == "inflight":
+        for name, max_inflight in (("paho default", None), ("max_inflight", args.max_pending)):
+            rate = bench_inflight(count, args.rtt, args.max_pending, max_inflight)
+            print(f"{name:13} {rate:8.0f} messages/s")
+        return
+
+    for wrapped in (False, True):
+        name = "publisher" if wrapped else "direct"
+        if args.mode == "rpc":
+            print(f"{name:10} {bench_rpc(count, args.concurrency, wrapped):8.0f} calls/s")
+        else:
+            peak, produced, delivered = bench_slow_link(count, args.rate, wrapped, args.max_pending)
+            print(
+                f"{name:10} peak unconfirmed {peak:7}   producer busy {produced:6.2f} s   "
+                f"delivered in {delivered:6.2f} s"
+            )
+
+
+if __name__ == "__main__":
+    main()
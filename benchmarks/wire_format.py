@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""JSON vs MessagePack throughput.
+
+For typical payloads prints the envelope size, encode + decode rate and the
+rate of full request handling by MQTTRPCResponseManager (parse request, call
+method, serialize reply) in both wire formats.
+
+    PYTHONPATH=. python3 benchmarks/wire_format.py [-n ITERATIONS]
+
+"""
+
+import argparse
+import functools
+import time
+
+from mqttrpc import MQTTRPCResponseManager
+from mqttrpc.dispatcher import Dispatcher
+from mqttrpc.wire import JSON, MSGPACK, available_formats, dumps, loads
+
+PAYLOADS = {
+    "small": {"channel": "K1", "value": 1},
+    "registers": list(range(0, 65536, 64)),
+    "floats": [i / 7.0 for i in range(1024)],
+    "config": {"devices": [{"slave_id": i, "type": "WB-MR6C", "channels": ["K1", "K2"]} for i in range(100)]},
+}
+
+
+def rate(fn, iterations):
+    started = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return iterations / (time.perf_counter() - started)
+
+
+def round_trip(request, wire_format):
+    loads(dumps(request, wire_format))
+
+
+def handle_payload(payload, dispatcher):
+    return MQTTRPCResponseManager.handle(payload, "bench", "echo", dispatcher).payload
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument("-n", "--iterations", type=int, default=2000, help="Iterations per measurement")
+    args = parser.parse_args()
+
+    if MSGPACK not in available_formats():
+        parser.error("msgpack is not installed")
+
+    dispatcher = Dispatcher()
+    dispatcher[("bench", "echo")] = lambda value: value
+
+    print(f"{'payload':10} {'format':8} {'size':>7} {'codec/s':>9} {'handled/s':>10}")
+    for name, value in PAYLOADS.items():
+        for wire_format in (JSON, MSGPACK):
+            request = {"params": {"value": value}, "id": 1}
+            payload = dumps(request, wire_format)
+            if isinstance(payload, str):
+                payload = payload.encode("utf-8")
+
+            codec = functools.partial(round_trip, request, wire_format)
+            handle = functools.partial(handle_payload, payload, dispatcher)
+
+            print(
+                f"{name:10} {wire_format:8} {len(payload):7} "
+                f"{rate(codec, args.iterations):9.0f} {rate(handle, args.iterations):10.0f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,46 @@
+import importlib
+
 __version = (0, 1, 0)
 
 __version__ = version = ".".join(map(str, __version))  # pylint: disable=invalid-name
 __project__ = PROJECT = __name__
 
 from .dispatcher import Dispatcher  # pylint: disable=wrong-import-position
-from .manager import MQTTRPCResponseManager  # pylint: disable=wrong-import-position
 
 dispatcher = Dispatcher()
 
+# Everything that depends on jsonrpc is imported on first access, so that
+# client-only and server-only users load just the modules they touch.
+_LAZY_ATTRS = {
+    "MQTTRPCResponseManager": ".manager",
+    "AMQTTRPCResponseManager": ".manager",
+    "TMQTTRPCClient": ".client",
+    "MQTTRPCError": ".client",
+    "TMQTTRPCClientPool": ".pool",
+    "TMQTTRPCPublisher": ".transport",
+}
+
+# typing.TYPE_CHECKING without importing typing, which alone costs more than this package
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    # never executed, lets linters and IDEs see the lazy names
+    from .client import MQTTRPCError, TMQTTRPCClient
+    from .manager import AMQTTRPCResponseManager, MQTTRPCResponseManager
+    from .pool import TMQTTRPCClientPool
+    from .transport import TMQTTRPCPublisher
+
+
+def __getattr__(name):
+    if name not in _LAZY_ATTRS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+    value = getattr(importlib.import_module(_LAZY_ATTRS[name], __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY_ATTRS))
+
+
 # lint_ignore=W0611,W0401
@@ -1,15 +1,40 @@
-import json
+import functools
 import threading
+import time
+from collections import deque
 
 import paho.mqtt.client as mqtt
-from jsonrpc.exceptions import JSONRPCException
 
-# ~ from concurrent.futures import Future
-from .protocol import MQTTRPC10Response
+from .wire import (
+    DEFAULT_COMPRESSION_THRESHOLD,
+    JSON,
+    ZLIB,
+    available_compressions,
+    decompress,
+    detect_compression,
+    dumps,
+    encode_payload,
+    loads,
+)
 
+# ~ from concurrent.futures import Future
 # ~ from concurrent.futures._base import TimeoutError
 
 
+@functools.lru_cache(maxsize=None)
+def _reply_classes():
+    # jsonrpc is only needed once a reply arrives, keep it out of import time
+    from jsonrpc.exceptions import (  # pylint: disable=import-outside-toplevel
+        JSONRPCException,
+    )
+
+    from .protocol import (  # pylint: disable=import-outside-toplevel
+        MQTTRPC10Response,
+    )
+
+    return JSONRPCException, MQTTRPC10Response
+
+
 class TimeoutError(Exception):  # pylint: disable=redefined-builtin
     pass
 
@@ -24,19 +49,39 @@ class MQTTRPCError(Exception):
         self.data = data
 
 
-class AsyncResult:
+class AsyncResult:  # pylint: disable=too-many-instance-attributes
     def __init__(self):
         self._event = threading.Event()
         self._result = None
         self._exception = None
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    def _set_done(self):
+        with self._lock:
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback(self)
 
     def set_result(self, result):
         self._result = result
-        self._event.set()
+        self._set_done()
 
     def set_exception(self, exception):
         self._exception = exception
-        self._event.set()
+        self._set_done()
+
+    def done(self):
+        return self._event.is_set()
+
+    def add_done_callback(self, fn):
+        """Call fn(future) once result is set, at once if it's already done"""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(fn)
+                return
+        fn(self)
 
     def _get_result(self):
         if self._exception:
@@ -54,13 +99,71 @@ class AsyncResult:
         raise TimeoutError()
 
 
-class TMQTTRPCClient:
-    def __init__(self, client):
+class TMQTTRPCClient:  # pylint: disable=too-many-instance-attributes
+    """MQTT-RPC client on top of paho client.
+
+    :param client: connected paho client, on_message should be routed to
+        on_mqtt_message.
+    :param compression: opt-in payload compression. True accepts every codec
+        available (zstd, then zlib) in replies, a codec name only that codec.
+        It is negotiated per driver, drivers without compression support keep
+        getting plain requests. Requests are compressed with zlib until the
+        driver replies with another codec, see :mod:`mqttrpc.wire`.
+    :raises ValueError: the codec is not available.
+    :param int compression_threshold: requests smaller than that (in bytes)
+        are sent uncompressed.
+    :param str wire_format: default envelope format, JSON or MessagePack
+        (mqttrpc.wire.JSON / mqttrpc.wire.MSGPACK). Can be overridden per call.
+    :param str rpc_client_id: reply namespace (client id topic segment),
+        defaults to the paho client id.
+    :param on_pending: called with 1 when a call starts waiting for reply
+        and with -1 when it stops (reply or timeout).
+
+    """
+
+    LATENCY_HISTORY = 100
+    DEFAULT_HEDGE_DELAY = 0.1
+
+    PARSE_ERROR_CODE = -32700
+    INVALID_REQUEST_CODE = -32600
+
+    def __init__(  # pylint: disable=too-many-arguments,too-many-positional-arguments
+        self,
+        client,
+        compression=None,
+        compression_threshold=DEFAULT_COMPRESSION_THRESHOLD,
+        wire_format=JSON,
+        rpc_client_id=None,
+        on_pending=None,
+    ):
         self.client = client
+        self.on_pending = on_pending
+        self.wire_format = wire_format
+        if compression is True:
+            self.compressions = available_compressions()
+        elif compression:
+            self.compressions = [compression]
+        else:
+            self.compressions = None
+        unsupported = set(self.compressions or ()) - set(available_compressions())
+        if unsupported:
+            raise ValueError(f"Unsupported compression {', '.join(sorted(unsupported))}")
+        self.compression_threshold = compression_threshold
+        # driver -> codec to compress requests with, None if it doesn't support compression
+        self.driver_compression = {}
+        # driver -> futures key of the request probing its compression support
+        self._compression_probes = {}
         self.counter = 0
         self.futures = {}
         self.subscribes = set()
-        if isinstance(self.client._client_id, bytes):
+        # driver -> recent latencies of successful replies, see driver_latency()
+        self.latencies = {}
+        # driver -> recent reply outcomes, True for success
+        self.outcomes = {}
+        self._lock = threading.Lock()
+        if rpc_client_id is not None:
+            self.rpc_client_id = rpc_client_id.replace("/", "_")
+        elif isinstance(self.client._client_id, bytes):
             self.rpc_client_id = self.client._client_id.decode().replace("/", "_")
         else:
             self.rpc_client_id = str(self.client._client_id).replace("/", "_")
@@ -78,29 +181,38 @@ class TMQTTRPCClient:
         service_id = parts[4]
         method_id = parts[5]
 
-        json_str = msg.payload.decode("utf8")
+        jsonrpc_exception, response_class = _reply_classes()
 
         try:
-            result = MQTTRPC10Response.from_json(json_str)
-        except JSONRPCException as err:
-            try:
-                data = json.loads(json_str)
-            except Exception:  # pylint: disable=broad-except
-                data = None
+            data, _ = loads(decompress(msg.payload))
+        except ValueError:
+            # no way to find out request id, let the call time out
+            return True
+
+        try:
+            result = response_class.from_data(data)
+            if result._id is None:  # pylint: disable=protected-access
+                self._on_anonymous_error(driver_id, service_id, method_id, result.error)
+                return True
+        except jsonrpc_exception as err:
             if isinstance(data, dict) and data.get("id") is not None:
-                future = self.futures.pop(
-                    (driver_id, service_id, method_id, data["id"]), None  # pylint: disable=protected-access
-                )
+                future = self._pop_future((driver_id, service_id, method_id, data["id"]))
                 if future is not None:
                     future.set_exception(err)
             return True
 
-        future = self.futures.pop(
-            (driver_id, service_id, method_id, result._id), None  # pylint: disable=protected-access
-        )
+        key = (driver_id, service_id, method_id, result._id)  # pylint: disable=protected-access
+        future = self._pop_future(key)
         if future is None:
             return True
 
+        if self.compressions:
+            self._on_compression_reply(key, detect_compression(msg.payload))
+
+        self._record_outcome(driver_id, not result.error)
+        if not result.error:
+            self._record_latency(driver_id, time.monotonic() - future.sent_at)
+
         if result.error:
             future.set_exception(
                 MQTTRPCError(
@@ -109,40 +221,264 @@ class TMQTTRPCClient:
                     result.error["data"] if "data" in result.error else None,
                 )
             )
-
-        future.set_result(result.result)
+        else:
+            future.set_result(result.result)
         return True
 
+    def _pop_future(self, key):
+        future = self.futures.pop(key, None)
+        if future is not None and self.on_pending is not None:
+            self.on_pending(-1)
+        return future
+
+    def _on_compression_reply(self, key, codec):
+        driver = key[0]
+        with self._lock:
+            if codec is not None:
+                # the driver both accepts the compression member and compresses with that codec
+                self.driver_compression[driver] = codec
+            elif self._compression_probes.get(driver) == key:
+                # every server accepting the compression member reads zlib
+                self.driver_compression[driver] = ZLIB
+            if self._compression_probes.get(driver) == key:
+                del self._compression_probes[driver]
+
+    def _on_anonymous_error(self, driver, service, method, error):
+        """Handle error reply with null id: the server couldn't parse the request.
+
+        If it is the compression probe, the driver doesn't support compression:
+        the probe is resent without the compression member. A parse error
+        falls requests to the driver back to zlib, the only codec it must read.
+
+        """
+        if not self.compressions or not error:
+            return
+
+        if error.get("code") == self.PARSE_ERROR_CODE:
+            with self._lock:
+                if self.driver_compression.get(driver) not in (None, ZLIB):
+                    self.driver_compression[driver] = ZLIB
+            return
+
+        if error.get("code") != self.INVALID_REQUEST_CODE:
+            return
+
+        with self._lock:
+            probe = self._compression_probes.get(driver)
+            if probe is None or probe[:3] != (driver, service, method):
+                # the driver may have been replaced by one without compression support, probe again
+                if self.driver_compression.get(driver) is not None:
+                    del self.driver_compression[driver]
+                return
+            del self._compression_probes[driver]
+            self.driver_compression[driver] = None
+            future = self.futures.get(probe)
+            if future is None:
+                return
+            future.payload = future.fallback_payload
+
+        self.client.publish(future.topic, future.payload)
+
+    def _record_latency(self, driver, latency):
+        history = self.latencies.get(driver)
+        if history is None:
+            history = self.latencies.setdefault(driver, deque(maxlen=self.LATENCY_HISTORY))
+        history.append(latency)
+
+    def _record_outcome(self, driver, success):
+        history = self.outcomes.get(driver)
+        if history is None:
+            history = self.outcomes.setdefault(driver, deque(maxlen=self.LATENCY_HISTORY))
+        history.append(success)
+
+    def driver_error_rate(self, driver):
+        """Return share (0..1) of error replies among recent replies of the driver"""
+        history = self.outcomes.get(driver)
+        if not history:
+            return 0.0
+        return 1.0 - sum(history) / len(history)
+
+    def _expected_latency(self, driver):
+        # median latency per successful reply, unknown drivers first
+        error_rate = self.driver_error_rate(driver)
+        if error_rate >= 1.0:
+            return float("inf")
+        return (self.driver_latency(driver) or 0) / (1.0 - error_rate)
+
+    def driver_latency(self, driver, percentile=50):
+        """Return percentile (0..100) of recent successful reply latencies, None if unknown"""
+        history = sorted(self.latencies.get(driver, ()))
+        if not history:
+            return None
+        return history[min(len(history) - 1, int(len(history) * percentile / 100.0))]
+
     def call(
-        self, driver, service, method, params, timeout=None
+        self, driver, service, method, params, timeout=None, wire_format=None, retries=0
     ):  # pylint: disable=too-many-arguments,too-many-positional-arguments
-        future = self.call_async(driver, service, method, params)
+        """Call method and wait for result.
 
-        try:
-            result = future.result(1e100 if timeout is None else timeout)
-        except TimeoutError as err:
-            # delete callback
-            self.futures.pop((driver, service, method, future.packet_id), None)
-            raise err
-        return result
+        On timeout the request is resent up to ``retries`` times with the same
+        id, so that the server is able to recognise the retry and not execute
+        the method again. Timeout applies to every attempt.
 
-    def call_async(
-        self, driver, service, method, params, result_future=AsyncResult
+        """
+        future = self.call_async(driver, service, method, params, wire_format=wire_format)
+
+        for attempt in range(retries + 1):
+            try:
+                return future.result(1e100 if timeout is None else timeout)
+            except TimeoutError as err:
+                if attempt == retries:
+                    # delete callback
+                    self._pop_future((driver, service, method, future.packet_id))
+                    raise err
+                self.client.publish(future.topic, future.payload)
+        return None
+
+    def call_hedged(  # pylint: disable=too-many-locals
+        self,
+        drivers,
+        service,
+        method,
+        params,
+        timeout=None,
+        hedge_delay=None,
+        hedge_percentile=95,
+        wire_format=None,
     ):  # pylint: disable=too-many-arguments,too-many-positional-arguments
-        self.counter += 1
-        payload = {"params": params, "id": self.counter}
+        """Call method of one of redundant drivers, returning the first successful result.
+
+        The request is sent to the driver with the lowest median latency of
+        successful replies, divided by its share of successful replies
+        (drivers with no replies yet are tried first, in the given order).
+        If there is no reply within the hedge delay, it is also sent to the
+        next driver, and so on. If a driver fails, the next one is tried at
+        once. Replies to the other copies are ignored.
+
+        :param list drivers: candidate drivers.
+        :param float timeout: overall timeout.
+        :param float hedge_delay: fixed hedge delay, in seconds. By default
+            hedge_percentile of the primary driver latency is used (or
+            DEFAULT_HEDGE_DELAY until it has replied).
+        :raises: error of the last driver if all of them failed.
+
+        """
+        if not drivers:
+            raise ValueError("No drivers given")
+
+        remaining = sorted(drivers, key=self._expected_latency)
+        if hedge_delay is None:
+            hedge_delay = self.driver_latency(remaining[0], hedge_percentile) or self.DEFAULT_HEDGE_DELAY
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        wakeup = threading.Event()
+        launched = []
+
+        def launch():
+            driver = remaining.pop(0)
+            future = self.call_async(driver, service, method, params, wire_format=wire_format)
+            future.add_done_callback(lambda _: wakeup.set())
+            launched.append((driver, future))
+            return time.monotonic() + hedge_delay
+
+        def cancel():
+            now = time.monotonic()
+            for driver, future in launched:
+                if self._pop_future((driver, service, method, future.packet_id)) is not None:
+                    # no reply yet, but it is at least that slow
+                    self._record_latency(driver, now - future.sent_at)
+
+        next_hedge = launch()
+        while True:
+            wakeup.clear()
+            for _, future in launched:
+                if future.done() and future.exception(0) is None:
+                    cancel()
+                    return future.result(0)
+
+            now = time.monotonic()
+            all_failed = all(future.done() for _, future in launched)
+            if remaining and (all_failed or now >= next_hedge):
+                next_hedge = launch()
+                continue
+            if all_failed:
+                raise launched[-1][1].exception(0)
+            if deadline is not None and now >= deadline:
+                cancel()
+                raise TimeoutError()
+
+            wait_until = next_hedge if remaining else deadline
+            if deadline is not None:
+                wait_until = min(wait_until, deadline)
+            wakeup.wait(None if wait_until is None else max(0, wait_until - now))
+
+    def call_async(
+        self, driver, service, method, params, result_future=AsyncResult, wire_format=None
+    ):  # pylint: disable=too-many-arguments,too-many-positional-arguments,too-many-locals
+        topic = f"/rpc/v1/{driver}/{service}/{method}/{self.rpc_client_id}"
+        wire_format = wire_format or self.wire_format
 
         result = result_future()
-        result.packet_id = self.counter  # pylint: disable=attribute-defined-outside-init
-        self.futures[(driver, service, method, self.counter)] = result
+        with self._lock:
+            packet_id = self.counter + 1
+            key = (driver, service, method, packet_id)
+
+            probe = False
+            codec = self.driver_compression.get(driver)
+            if self.compressions and driver not in self.driver_compression:
+                probe_key = self._compression_probes.get(driver)
+                # one probe per driver at a time, the others go plain until it is answered
+                probe = probe_key is None or probe_key not in self.futures
+
+            # encode before anything is registered, so a failure leaves no trace;
+            # under the lock, so the probe decision and its registration are atomic
+            payload = {"params": params, "id": packet_id}
+            # kept for resending, see call()
+            # pylint: disable=attribute-defined-outside-init
+            result.topic = topic
+            if probe or codec is not None:
+                if probe:
+                    result.fallback_payload = self._encode(payload, wire_format)
+                payload["compression"] = self.compressions
+            result.payload = self._encode(payload, wire_format, codec)
+            result.packet_id = packet_id
+            # pylint: enable=attribute-defined-outside-init
+
+            self.counter = packet_id
+            if probe:
+                self._compression_probes[driver] = key
+            self.futures[key] = result
+            if self.on_pending is not None:
+                self.on_pending(1)
+
+            # subscribe under the lock, so concurrent calls are published after it
+            subscribe_key = (driver, service, method)
+            if subscribe_key not in self.subscribes:
+                self.subscribes.add(subscribe_key)
+                self.client.subscribe(f"{topic}/reply")
+
+        result.sent_at = time.monotonic()  # pylint: disable=attribute-defined-outside-init
+        self.client.publish(topic, result.payload)
 
-        topic = f"/rpc/v1/{driver}/{service}/{method}/{self.rpc_client_id}"
+        return result
 
-        subscribe_key = (driver, service, method)
-        if subscribe_key not in self.subscribes:
-            self.subscribes.add(subscribe_key)
-            self.client.subscribe(f"{topic}/reply")
+    def notify(
+        self, driver, service, method, params, wire_format=None
+    ):  # pylint: disable=too-many-arguments,too-many-positional-arguments
+        """Send notification: request without id, server doesn't reply to it.
 
-        self.client.publish(topic, json.dumps(payload))
+        Nothing is allocated or subscribed, so it is cheap enough for high-rate
+        commands. Returns paho publish result.
 
-        return result
+        """
+        topic = f"/rpc/v1/{driver}/{service}/{method}/{self.rpc_client_id}"
+        payload = self._encode(
+            {"params": params}, wire_format or self.wire_format, self.driver_compression.get(driver)
+        )
+        return self.client.publish(topic, payload)
+
+    def _encode(self, payload, wire_format, codec=None):
+        data = dumps(payload, wire_format)
+        if codec is None:
+            return data
+        return encode_payload(data, codec, self.compression_threshold)
@@ -0,0 +1,130 @@
+"""Server-side suppression of retried requests.
+
+A client that timed out may resend the request with the same id (see
+``retries`` of :meth:`mqttrpc.client.TMQTTRPCClient.call`). Response managers
+given a :class:`MQTTRPCDedupTable` don't execute such a duplicate again:
+
+* if the first request is still being handled, the duplicate waits for it
+  (up to ``wait_timeout`` seconds) and gets the same response. If the wait
+  times out, the duplicate is dropped without a reply: the client gets the
+  reply of the first request anyway, it has the same id;
+* if it has been handled not longer than ``ttl`` seconds ago, the cached
+  response is returned. Its serialized payload is kept with it.
+
+A digest of the raw request payload is stored with every entry. A request
+with a known key but a different payload (e.g. a client restarted and
+counts ids from 1 again) is a new request: it replaces the handled one, or is
+handled without suppression if the other one is still running.
+
+Requests being handled are never dropped from the table, ``maxsize`` and
+``ttl`` only limit handled ones.
+
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+
+class _Entry:  # pylint: disable=too-few-public-methods
+    __slots__ = ("digest", "response", "expires_at", "event", "future")
+
+    def __init__(self, digest):
+        self.digest = digest
+        self.response = None
+        self.expires_at = None
+        self.event = threading.Event()
+        # asyncio future for AMQTTRPCResponseManager, created by the owner
+        self.future = None
+
+
+class MQTTRPCDedupTable:
+    """Bounded table of recent requests, keyed by (client_id, service, method, id).
+
+    :param int maxsize: max number of remembered responses, the oldest are
+        dropped first.
+    :param float ttl: how long (in seconds) a response is kept after the
+        request has been handled.
+    :param float wait_timeout: how long a duplicate waits for the request
+        being handled.
+
+    """
+
+    def __init__(self, maxsize=1024, ttl=60.0, wait_timeout=10.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.wait_timeout = wait_timeout
+        # requests being handled
+        self._running = {}
+        # handled requests, ordered by expiration as ttl is the same for all
+        self._completed = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._running) + len(self._completed)
+
+    def _evict(self, now):
+        while self._completed:
+            entry = next(iter(self._completed.values()))
+            if entry.expires_at > now:
+                break
+            self._completed.popitem(last=False)
+
+        while len(self._completed) > self.maxsize:
+            self._completed.popitem(last=False)
+
+    @staticmethod
+    def digest(payload):
+        """Digest of raw request payload, to be passed to acquire()"""
+        if isinstance(payload, str):
+            payload = payload.encode("utf-8")
+        return hashlib.blake2b(payload, digest_size=16).digest()
+
+    def acquire(self, key, digest=None):
+        """Look up request, registering it if it is new.
+
+        :param digest: digest() of the request payload. An entry with the same
+            key, but another digest belongs to a different request.
+        :return tuple: (entry, is_new). The caller of a new entry must handle
+            the request and call complete() (or discard() on failure).
+
+        """
+        with self._lock:
+            self._evict(time.monotonic())
+            entry = self._running.get(key)
+            if entry is not None:
+                if entry.digest == digest:
+                    return entry, False
+                # a different request, not remembered, the running one keeps the key
+                return _Entry(digest), True
+
+            entry = self._completed.get(key)
+            if entry is not None:
+                if entry.digest == digest:
+                    return entry, False
+                del self._completed[key]
+            entry = self._running[key] = _Entry(digest)
+            return entry, True
+
+    def complete(self, key, entry, response):
+        with self._lock:
+            entry.response = response
+            entry.expires_at = time.monotonic() + self.ttl
+            if self._running.get(key) is entry:
+                del self._running[key]
+                self._completed[key] = entry
+                self._evict(time.monotonic())
+        self._wake(entry)
+
+    def discard(self, key, entry):
+        with self._lock:
+            if self._running.get(key) is entry:
+                del self._running[key]
+        self._wake(entry)
+
+    @staticmethod
+    def _wake(entry):
+        entry.event.set()
+        if entry.future is not None and not entry.future.done():
+            entry.future.set_result(entry.response)
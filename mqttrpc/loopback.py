@@ -0,0 +1,156 @@
+"""In-process stand-in for an MQTT broker.
+
+:class:`LoopbackClient` implements the part of paho client interface used by
+mqttrpc (subscribe, publish, on_message, on_publish, _client_id), so clients, servers and
+tools can be run and measured without network::
+
+    broker = LoopbackBroker()
+    server_client = broker.client("server")
+    rpc_client = TMQTTRPCClient(broker.client("client"))
+
+Like paho network loop, every client delivers its messages from a separate
+thread, started by loop_start().
+
+"""
+
+import itertools
+import queue
+import threading
+
+import paho.mqtt.client as mqtt
+from paho.mqtt.packettypes import PacketTypes
+from paho.mqtt.reasoncodes import ReasonCode
+
+# passed to every on_publish, building it is more expensive than the publish itself
+_PUBACK_SUCCESS = ReasonCode(PacketTypes.PUBACK)
+
+
+class LoopbackMessage:  # pylint: disable=too-few-public-methods
+    __slots__ = ("topic", "payload", "qos", "retain", "mid")
+
+    def __init__(self, topic, payload, qos=0, retain=False, mid=0):  # pylint: disable=too-many-arguments
+        self.topic = topic
+        self.payload = payload
+        self.qos = qos
+        self.retain = retain
+        self.mid = mid
+
+
+class LoopbackMessageInfo:
+    """Result of LoopbackClient.publish, message is delivered to broker at once"""
+
+    rc = mqtt.MQTT_ERR_SUCCESS
+
+    def __init__(self, mid):
+        self.mid = mid
+
+    def wait_for_publish(self, timeout=None):  # pylint: disable=unused-argument
+        return None
+
+    def is_published(self):
+        return True
+
+
+class LoopbackBroker:  # pylint: disable=too-few-public-methods
+    def __init__(self):
+        self._clients = []
+        self._retained = {}
+        self._lock = threading.Lock()
+
+    def client(self, client_id):
+        client = LoopbackClient(self, client_id)
+        with self._lock:
+            self._clients.append(client)
+        return client
+
+    def _remove(self, client):
+        with self._lock:
+            if client in self._clients:
+                self._clients.remove(client)
+
+    def _subscribe(self, client, topic):
+        with self._lock:
+            retained = [msg for msg in self._retained.values() if mqtt.topic_matches_sub(topic, msg.topic)]
+        for msg in retained:
+            client._deliver(msg)  # pylint: disable=protected-access
+
+    def _publish(self, msg):
+        with self._lock:
+            if msg.retain:
+                if msg.payload:
+                    self._retained[msg.topic] = msg
+                else:
+                    self._retained.pop(msg.topic, None)
+            clients = list(self._clients)
+        for client in clients:
+            if client._matches(msg.topic):  # pylint: disable=protected-access
+                client._deliver(msg)  # pylint: disable=protected-access
+
+
+class LoopbackClient:  # pylint: disable=too-many-instance-attributes
+    """paho-like client connected to LoopbackBroker"""
+
+    def __init__(self, broker, client_id):
+        self.broker = broker
+        self._client_id = client_id.encode() if isinstance(client_id, str) else client_id
+        self._subscriptions = set()
+        self._mids = itertools.count(1)
+        self._queue = queue.SimpleQueue()
+        self._thread = None
+        self.on_message = None
+        self.on_publish = None
+        self.user_data = None
+
+    def _matches(self, topic):
+        return any(mqtt.topic_matches_sub(sub, topic) for sub in list(self._subscriptions))
+
+    def _deliver(self, msg):
+        self._queue.put(msg)
+
+    def _loop(self):
+        while True:
+            msg = self._queue.get()
+            if msg is None:
+                return
+            if self.on_message is not None:
+                self.on_message(self, self.user_data, msg)
+
+    def loop_start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, daemon=True)
+            self._thread.start()
+
+    def loop_stop(self):
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def disconnect(self):
+        self.broker._remove(self)  # pylint: disable=protected-access
+        self.loop_stop()
+
+    def subscribe(self, topic, qos=0):  # pylint: disable=unused-argument
+        self._subscriptions.add(topic)
+        self.broker._subscribe(self, topic)  # pylint: disable=protected-access
+        return mqtt.MQTT_ERR_SUCCESS, next(self._mids)
+
+    def unsubscribe(self, topic):
+        self._subscriptions.discard(topic)
+        return mqtt.MQTT_ERR_SUCCESS, next(self._mids)
+
+    def publish(self, topic, payload=None, qos=0, retain=False):
+        if payload is None:
+            payload = b""
+        elif isinstance(payload, str):
+            payload = payload.encode("utf-8")
+        elif isinstance(payload, (int, float)):
+            payload = str(payload).encode("ascii")
+
+        mid = next(self._mids)
+        msg = LoopbackMessage(topic, payload, qos, retain, mid)
+        self.broker._publish(msg)  # pylint: disable=protected-access
+        if self.on_publish is not None:
+            # paho callback API version 2 signature
+            self.on_publish(self, self.user_data, mid, _PUBACK_SUCCESS, None)
+        return LoopbackMessageInfo(mid)
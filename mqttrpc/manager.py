@@ -1,4 +1,4 @@
-import json
+import asyncio
 import logging
 
 from jsonrpc.exceptions import (
@@ -13,6 +13,7 @@ from jsonrpc.exceptions import (
 from jsonrpc.utils import is_invalid_params
 
 from .protocol import MQTTRPC10Request, MQTTRPC10Response
+from .wire import choose_compression, decompress, loads
 
 logger = logging.getLogger(__name__)
 
@@ -25,37 +26,68 @@ class MQTTRPCResponseManager:
     Request could be handled in parallel, it is server responsibility.
 
     :param str request_str: json string. Will be converted into
-        MQTTRPC10Request
+        MQTTRPC10Request. MessagePack and compressed payloads (bytes) are
+        accepted too, the response uses the same wire format.
 
     :param dict dispather: dict<function_name:function>.
 
+    :param str client_id: client id from the request topic.
+
+    :param MQTTRPCDedupTable dedup: if given together with client_id,
+        retried requests are not executed again, see :mod:`mqttrpc.dedup`.
+
     """
 
     @classmethod
     def _prepare_request(cls, request_str):
-        if isinstance(request_str, bytes):
-            request_str = request_str.decode("utf-8")
         try:
-            json.loads(request_str)
+            if isinstance(request_str, bytes):
+                request_str = decompress(request_str)
+            data, wire_format = loads(request_str)
         except (TypeError, ValueError):
             return None, MQTTRPC10Response(
                 error=JSONRPCParseError()._data  # pylint: disable=protected-access
             )
         try:
-            request = MQTTRPC10Request.from_json(request_str)
+            request = MQTTRPC10Request.from_data(data)
         except JSONRPCInvalidRequestException:
-            return None, MQTTRPC10Response(
+            response = MQTTRPC10Response(
                 error=JSONRPCInvalidRequest()._data  # pylint: disable=protected-access
             )
+            response.wire_format = wire_format
+            return None, response
 
+        request.wire_format = wire_format
         return request, None
 
     @classmethod
-    def handle(cls, request_str, service_id, method_id, dispatcher):
+    def handle(
+        cls, request_str, service_id, method_id, dispatcher, client_id=None, dedup=None
+    ):  # pylint: disable=too-many-arguments,too-many-positional-arguments
         request, erroneous_response = cls._prepare_request(request_str)
-        if request:
+        if not request:
+            return erroneous_response
+        if dedup is None or client_id is None or request.is_notification:
             return cls.handle_request(request, service_id, method_id, dispatcher)
-        return erroneous_response
+
+        key = (client_id, service_id, method_id, request._id)  # pylint: disable=protected-access
+        entry, is_new = dedup.acquire(key, dedup.digest(request_str))
+        if not is_new:
+            if not entry.event.wait(dedup.wait_timeout):
+                # the first request will reply with the same id
+                return []
+            if entry.response is not None:
+                return entry.response
+
+        try:
+            response = cls.handle_request(request, service_id, method_id, dispatcher)
+        except BaseException:
+            if is_new:
+                dedup.discard(key, entry)
+            raise
+        if is_new:
+            dedup.complete(key, entry, response)
+        return response
 
     @classmethod
     def _process_exception(cls, request, method, e):
@@ -106,6 +138,8 @@ class MQTTRPCResponseManager:
                 output = MQTTRPC10Response(_id=request._id, result=result)  # pylint: disable=protected-access
         finally:
             if not request.is_notification:
+                output.wire_format = request.wire_format
+                output.compression = choose_compression(request.compression)
                 return output  # pylint: disable=return-in-finally, lost-exception
             return []  # pylint: disable=return-in-finally, lost-exception
 
@@ -117,12 +151,37 @@ class AMQTTRPCResponseManager(MQTTRPCResponseManager):
 
     @classmethod
     async def handle(
-        cls, request_str, service_id, method_id, dispatcher
-    ):  # pylint: disable=invalid-overridden-method
+        cls, request_str, service_id, method_id, dispatcher, client_id=None, dedup=None
+    ):  # pylint: disable=invalid-overridden-method,too-many-arguments,too-many-positional-arguments
         request, erroneous_response = cls._prepare_request(request_str)
-        if request:
+        if not request:
+            return erroneous_response
+        if dedup is None or client_id is None or request.is_notification:
             return await cls.handle_request(request, service_id, method_id, dispatcher)
-        return erroneous_response
+
+        key = (client_id, service_id, method_id, request._id)  # pylint: disable=protected-access
+        entry, is_new = dedup.acquire(key, dedup.digest(request_str))
+        if not is_new:
+            if entry.future is not None:
+                try:
+                    await asyncio.wait_for(asyncio.shield(entry.future), dedup.wait_timeout)
+                except asyncio.TimeoutError:
+                    # the first request will reply with the same id
+                    return []
+            if entry.response is not None:
+                return entry.response
+        else:
+            entry.future = asyncio.get_running_loop().create_future()
+
+        try:
+            response = await cls.handle_request(request, service_id, method_id, dispatcher)
+        except BaseException:
+            if is_new:
+                dedup.discard(key, entry)
+            raise
+        if is_new:
+            dedup.complete(key, entry, response)
+        return response
 
     @classmethod
     async def handle_request(
@@ -143,5 +202,7 @@ class AMQTTRPCResponseManager(MQTTRPCResponseManager):
                 output = MQTTRPC10Response(_id=request._id, result=result)  # pylint: disable=protected-access
         finally:
             if not request.is_notification:
+                output.wire_format = request.wire_format
+                output.compression = choose_compression(request.compression)
                 return output  # pylint: disable=return-in-finally, lost-exception
             return []  # pylint: disable=return-in-finally, lost-exception
@@ -0,0 +1,156 @@
+"""Many logical RPC clients on top of a few shared MQTT connections.
+
+Every logical client gets its own reply namespace (the client id segment of
+the topic), one per connection: ``<pool id>_<name>_<connection index>``.
+Replies are routed by that segment to the right logical client and then by
+request id to the pending call, as in :class:`mqttrpc.client.TMQTTRPCClient`.
+
+Each call goes over the connection with the fewest requests in flight (ties
+are taken in turn), so a slow reply or a congested socket doesn't hold up
+calls on the others.
+
+Example::
+
+    connections = [MQTTClient(f"my-service-{i}", broker_url) for i in range(2)]
+    pool = TMQTTRPCClientPool(connections)
+    for connection in connections:
+        connection.on_message = pool.on_mqtt_message
+        connection.start()
+
+    rpc_client = pool.create_client("scheduler")
+    rpc_client.call("wb-mqtt-serial", "port", "Load", {...})
+
+"""
+
+import functools
+import itertools
+import threading
+
+from .client import TMQTTRPCClient
+
+
+class TMQTTRPCPooledClient:
+    """Logical RPC client created by :meth:`TMQTTRPCClientPool.create_client`.
+
+    Has the same call interface as TMQTTRPCClient.
+
+    """
+
+    def __init__(self, pool, name, clients):
+        self.pool = pool
+        self.name = name
+        # one TMQTTRPCClient per pool connection, in the same order
+        self.clients = clients
+
+    def _pick(self):
+        return self.clients[self.pool.pick()]
+
+    def call(
+        self, driver, service, method, params, timeout=None, wire_format=None, retries=0
+    ):  # pylint: disable=too-many-arguments,too-many-positional-arguments
+        return self._pick().call(
+            driver, service, method, params, timeout, wire_format=wire_format, retries=retries
+        )
+
+    def call_hedged(self, drivers, service, method, params, **kwargs):
+        return self._pick().call_hedged(drivers, service, method, params, **kwargs)
+
+    def call_async(
+        self, driver, service, method, params, wire_format=None, **kwargs
+    ):  # pylint: disable=too-many-arguments,too-many-positional-arguments
+        return self._pick().call_async(driver, service, method, params, wire_format=wire_format, **kwargs)
+
+    def notify(
+        self, driver, service, method, params, wire_format=None
+    ):  # pylint: disable=too-many-arguments,too-many-positional-arguments
+        return self._pick().notify(driver, service, method, params, wire_format=wire_format)
+
+
+class TMQTTRPCClientPool:  # pylint: disable=too-many-instance-attributes
+    """Pool of MQTT connections shared by many logical RPC clients.
+
+    :param list clients: connected paho clients. Their on_message should be
+        routed to on_mqtt_message.
+    :param kwargs: passed to every TMQTTRPCClient (compression, wire_format...)
+
+    """
+
+    def __init__(self, clients, **kwargs):
+        self.clients = list(clients)
+        if not self.clients:
+            raise ValueError("At least one MQTT client is required")
+
+        client_id = self.clients[0]._client_id  # pylint: disable=protected-access
+        if isinstance(client_id, bytes):
+            client_id = client_id.decode()
+        self.pool_id = str(client_id).replace("/", "_")
+
+        self._client_kwargs = kwargs
+        self._counter = itertools.count(1)
+        self._round_robin = itertools.count()
+        self._lock = threading.Lock()
+        # calls waiting for reply, per connection
+        self._pending = [0] * len(self.clients)
+        self._pending_lock = threading.Lock()
+        # rpc_client_id -> TMQTTRPCClient
+        self._routes = {}
+
+    def create_client(self, name=None):
+        """Create logical client with its own reply namespace.
+
+        :param str name: namespace suffix, must be unique within the pool and
+            must not contain MQTT wildcards. Sequential number by default.
+
+        """
+        if name is None:
+            name = str(next(self._counter))
+
+        with self._lock:
+            clients = []
+            for index, connection in enumerate(self.clients):
+                rpc_client_id = f"{self.pool_id}_{name}_{index}".replace("/", "_")
+                if rpc_client_id in self._routes:
+                    raise ValueError(f"Client {name} already exists")
+                rpc_client = TMQTTRPCClient(
+                    connection,
+                    rpc_client_id=rpc_client_id,
+                    on_pending=functools.partial(self._on_pending, index),
+                    **self._client_kwargs,
+                )
+                self._routes[rpc_client_id] = rpc_client
+                clients.append(rpc_client)
+
+        return TMQTTRPCPooledClient(self, name, clients)
+
+    def _on_pending(self, index, delta):
+        with self._pending_lock:
+            self._pending[index] += delta
+
+    def pending(self):
+        """Return number of calls waiting for reply, per connection."""
+        return list(self._pending)
+
+    def pick(self):
+        """Return index of the connection with the fewest calls in flight, taking ties in turn."""
+        pending = self._pending
+        count = len(pending)
+        start = next(self._round_robin) % count
+        best = start
+        for offset in range(1, count):
+            index = (start + offset) % count
+            if pending[index] < pending[best]:
+                best = index
+        return best
+
+    def on_mqtt_message(self, mosq, obj, msg):
+        """return True if the message was a reply to one of the pool clients"""
+
+        parts = msg.topic.split("/")
+        if len(parts) != 8 or parts[7] != "reply":
+            return False
+
+        rpc_client = self._routes.get(parts[6])
+        if rpc_client is None:
+            return False
+
+        return rpc_client.on_mqtt_message(mosq, obj, msg)
@@ -1,15 +1,23 @@
 from jsonrpc.exceptions import JSONRPCError, JSONRPCInvalidRequestException
 from jsonrpc.utils import JSONSerializable
 
+from .wire import DEFAULT_COMPRESSION_THRESHOLD, JSON, dumps, encode_payload
+
 
 class MQTTRPCBaseRequest(JSONSerializable):
     """Base class for JSON-RPC 1.0 and JSON-RPC 2.0 requests."""
 
-    def __init__(self, params=None, _id=None, is_notification=None):  # pylint: disable=super-init-not-called
+    # Format the request was received in, see mqttrpc.wire. Not a part of data.
+    wire_format = JSON
+
+    def __init__(
+        self, params=None, _id=None, is_notification=None, compression=None
+    ):  # pylint: disable=super-init-not-called
         self.data = {}
         self.params = params
         self._id = _id
         self.is_notification = is_notification
+        self.compression = compression
 
     @property
     def data(self):
@@ -48,6 +56,14 @@ class MQTTRPCBaseRequest(JSONSerializable):
 class MQTTRPCBaseResponse(JSONSerializable):
     """Base class for JSON-RPC 1.0 and JSON-RPC 2.0 responses."""
 
+    # Format and codec negotiated with the client, used by payload.
+    # Not a part of data.
+    wire_format = JSON
+    compression = None
+    compression_threshold = DEFAULT_COMPRESSION_THRESHOLD
+    # (wire_format, compression, compression_threshold, payload) of the last payload
+    _payload_cache = None
+
     def __init__(self, result=None, error=None, _id=None):  # pylint: disable=super-init-not-called
         self.data = {}
 
@@ -73,6 +89,20 @@ class MQTTRPCBaseResponse(JSONSerializable):
     def json(self):  # pylint: disable=invalid-overridden-method
         return self.serialize(self.data)
 
+    @property
+    def payload(self):
+        """Serialized response ready to be published, compressed if negotiated.
+
+        It is computed once, so a response cached for duplicate requests
+        (see :mod:`mqttrpc.dedup`) is not serialized again.
+
+        """
+        key = (self.wire_format, self.compression, self.compression_threshold)
+        if self._payload_cache is None or self._payload_cache[:3] != key:
+            payload = encode_payload(dumps(self.data, self.wire_format), *key[1:])
+            self._payload_cache = key + (payload,)
+        return self._payload_cache[3]
+
 
 class MQTTRPC10Request(MQTTRPCBaseRequest):
     """A rpc call is represented by sending a Request object to a Server.
@@ -91,6 +121,10 @@ class MQTTRPC10Request(MQTTRPCBaseRequest):
         value is True, _id is not included to request. It allows to create
         requests with id = null.
 
+    :param list compression: Codecs the Client is able to decompress, most
+        preferred first. The Server MAY compress the Response with one of
+        them. This member MAY be omitted, see :mod:`mqttrpc.wire`.
+
     The Server MUST reply with the same value in the Response object if
     included. This member is used to correlate the context between the two
     objects.
@@ -106,7 +140,7 @@ class MQTTRPC10Request(MQTTRPCBaseRequest):
     """
 
     REQUIRED_FIELDS = set([])
-    POSSIBLE_FIELDS = set(["params", "id"])
+    POSSIBLE_FIELDS = set(["params", "id", "compression"])
 
     @property
     def data(self):
@@ -145,10 +179,25 @@ class MQTTRPC10Request(MQTTRPCBaseRequest):
 
         self._data["id"] = value
 
+    @property
+    def compression(self):
+        return self._data.get("compression")
+
+    @compression.setter
+    def compression(self, value):
+        if value is not None:
+            if not isinstance(value, list) or not all(isinstance(codec, str) for codec in value):
+                raise ValueError("compression should be list of strings")
+
+            self._data["compression"] = value
+
     @classmethod
     def from_json(cls, json_str):
-        data = cls.deserialize(json_str)
+        return cls.from_data(cls.deserialize(json_str))
 
+    @classmethod
+    def from_data(cls, data):
+        """Build request from already deserialized envelope (JSON or MessagePack)."""
         if not data:
             raise JSONRPCInvalidRequestException("[] value is not accepted")
 
@@ -167,6 +216,7 @@ class MQTTRPC10Request(MQTTRPCBaseRequest):
                 params=data.get("params"),
                 _id=data.get("id"),
                 is_notification="id" not in data,
+                compression=data.get("compression"),
             )
         except ValueError as e:
             raise JSONRPCInvalidRequestException(str(e)) from e
@@ -257,8 +307,11 @@ class MQTTRPC10Response(MQTTRPCBaseResponse):
 
     @classmethod
     def from_json(cls, json_str):
-        data = cls.deserialize(json_str)
+        return cls.from_data(cls.deserialize(json_str))
 
+    @classmethod
+    def from_data(cls, data):
+        """Build response from already deserialized envelope (JSON or MessagePack)."""
         if not isinstance(data, dict):
             raise JSONRPCInvalidRequestException("Response should be an object (dict)")
 
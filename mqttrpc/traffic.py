@@ -0,0 +1,339 @@
+"""Recording and replaying of MQTT-RPC traffic for capacity testing.
+
+Recording is an append-only binary file: a header followed by records of
+
+    <float64 timestamp> <uint16 topic length> <uint32 payload length> <topic> <payload>
+
+(little-endian). Payloads are kept as they were on the wire, so compressed
+and MessagePack traffic is recorded as is.
+
+:class:`TrafficRecorder` is a passive listener: subscribe it to all requests
+and replies (see :meth:`TrafficRecorder.subscribe`) or wrap existing
+on_message handlers with :meth:`TrafficRecorder.wrap`. Latencies are derived
+from the timestamps of matching requests and replies, see :func:`analyze`.
+
+:func:`replay` re-issues recorded requests through a TMQTTRPCClient at the
+recorded pace, N times faster or as fast as possible, and reports throughput,
+latency percentiles and errors. :class:`TRecordedResponder` answers requests
+with recorded replies, so that replay can be run on a LoopbackBroker
+(see :mod:`mqttrpc.loopback`) with no network and no real server.
+
+"""
+
+import json
+import math
+import struct
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .client import MQTTRPCError, TimeoutError  # pylint: disable=redefined-builtin
+from .wire import decompress, dumps, loads
+
+FILE_HEADER = b"MQTTRPC-TRAFFIC\x01"
+
+REQUEST_TOPIC = "/rpc/v1/+/+/+/+"
+REPLY_TOPIC = "/rpc/v1/+/+/+/+/reply"
+
+_RECORD_HEADER = struct.Struct("<dHI")
+
+
+class Record:
+    __slots__ = ("timestamp", "topic", "payload")
+
+    def __init__(self, timestamp, topic, payload):
+        self.timestamp = timestamp
+        self.topic = topic
+        self.payload = payload
+
+    @property
+    def is_reply(self):
+        return self.topic.endswith("/reply")
+
+    def decode(self):
+        """Return (driver, service, method, client_id, data, wire_format) or None if malformed"""
+        parts = self.topic.split("/")
+        if len(parts) not in (7, 8):
+            return None
+        try:
+            data, wire_format = loads(decompress(self.payload))
+        except ValueError:
+            return None
+        if not isinstance(data, dict):
+            return None
+        return parts[3], parts[4], parts[5], parts[6], data, wire_format
+
+
+class TrafficRecorder:
+    """Appends messages to the recording file.
+
+    :param str path: file to append to, created if missing.
+
+    """
+
+    def __init__(self, path):
+        self._file = open(path, "ab")  # pylint: disable=consider-using-with
+        if self._file.tell() == 0:
+            self._file.write(FILE_HEADER)
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+    def flush(self):
+        with self._lock:
+            self._file.flush()
+
+    def record(self, topic, payload, timestamp=None):
+        if isinstance(payload, str):
+            payload = payload.encode("utf-8")
+        topic = topic.encode("utf-8")
+        header = _RECORD_HEADER.pack(
+            time.time() if timestamp is None else timestamp, len(topic), len(payload)
+        )
+        with self._lock:
+            # messages may still arrive from network thread after close()
+            if not self._file.closed:
+                self._file.write(header + topic + payload)
+
+    def subscribe(self, client):
+        """Subscribe client to all RPC requests and replies.
+
+        Its on_message should be routed to on_mqtt_message.
+
+        """
+        client.subscribe(REQUEST_TOPIC)
+        client.subscribe(REPLY_TOPIC)
+
+    def on_mqtt_message(self, mosq, obj, msg):  # pylint: disable=unused-argument
+        if msg.topic.startswith("/rpc/v1/"):
+            self.record(msg.topic, msg.payload)
+
+    def wrap(self, on_message):
+        """Return on_message handler recording messages before passing them to the given one"""
+
+        def handler(mosq, obj, msg):
+            self.on_mqtt_message(mosq, obj, msg)
+            return on_message(mosq, obj, msg)
+
+        return handler
+
+
+def read_records(path):
+    """Yield Record-s from the recording file"""
+    with open(path, "rb") as f:
+        if f.read(len(FILE_HEADER)) != FILE_HEADER:
+            raise ValueError(f"{path} is not a MQTT-RPC traffic recording")
+        while True:
+            header = f.read(_RECORD_HEADER.size)
+            if len(header) < _RECORD_HEADER.size:
+                return
+            timestamp, topic_len, payload_len = _RECORD_HEADER.unpack(header)
+            body = f.read(topic_len + payload_len)
+            if len(body) < topic_len + payload_len:
+                # the last record is truncated, recorder was interrupted
+                return
+            yield Record(timestamp, body[:topic_len].decode("utf-8"), body[topic_len:])
+
+
+def percentile(values, p):
+    """Return p-th (0..100) percentile of sorted values, nearest rank"""
+    if not values:
+        return None
+    rank = math.ceil(p / 100.0 * len(values))
+    return values[min(len(values), max(rank, 1)) - 1]
+
+
+class TrafficStats:
+    """Throughput, latency and error statistics of a recording or replay"""
+
+    PERCENTILES = (50, 90, 99, 99.9)
+
+    def __init__(self):
+        self.latencies = []
+        self.requests = 0
+        self.notifications = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.duration = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, latency=None, error=False, timeout=False):
+        with self._lock:
+            if latency is not None:
+                self.latencies.append(latency)
+            self.errors += bool(error)
+            self.timeouts += bool(timeout)
+
+    def report(self):
+        latencies = sorted(self.latencies)
+        total = self.requests + self.notifications
+        return {
+            "requests": self.requests,
+            "notifications": self.notifications,
+            "duration": self.duration,
+            "throughput": total / self.duration if self.duration > 0 else None,
+            "errors": self.errors,
+            "timeouts": self.timeouts,
+            "error_rate": (self.errors + self.timeouts) / self.requests if self.requests else 0.0,
+            "latency": {f"p{p:g}": percentile(latencies, p) for p in self.PERCENTILES},
+        }
+
+
+def _request_key(decoded):
+    driver, service, method, client_id, data, _ = decoded
+    return (driver, service, method, client_id, data.get("id"))
+
+
+def analyze(records):
+    """Return TrafficStats of the recorded traffic, matching requests with replies"""
+    stats = TrafficStats()
+    pending = {}
+    first = last = None
+    for record in records:
+        first = record.timestamp if first is None else first
+        last = record.timestamp
+        decoded = record.decode()
+        if decoded is None:
+            continue
+        if not record.is_reply:
+            if "id" in decoded[4]:
+                stats.requests += 1
+                pending[_request_key(decoded)] = record.timestamp
+            else:
+                stats.notifications += 1
+            continue
+        sent = pending.pop(_request_key(decoded), None)
+        if sent is not None:
+            stats.add(record.timestamp - sent, error=decoded[4].get("error") is not None)
+    stats.timeouts = len(pending)
+    stats.duration = (last - first) if first is not None else 0.0
+    return stats
+
+
+def replay(
+    records, rpc_client, speed=1.0, concurrency=16, timeout=10, driver=None
+):  # pylint: disable=too-many-arguments,too-many-positional-arguments,too-many-locals
+    """Re-issue recorded requests and measure the result.
+
+    :param records: iterable of Record-s, replies are skipped.
+    :param rpc_client: TMQTTRPCClient (or pooled client) to send requests with.
+    :param float speed: 1 for recorded pace, N for N times faster, None for
+        as fast as possible.
+    :param int concurrency: max number of requests in flight.
+    :param float timeout: per request timeout.
+    :param str driver: send to this driver instead of the recorded one.
+    :return TrafficStats:
+
+    """
+    stats = TrafficStats()
+    slots = threading.BoundedSemaphore(concurrency)
+
+    def call(decoded):
+        rec_driver, service, method, _, data, wire_format = decoded
+        sent = time.perf_counter()
+        try:
+            rpc_client.call(
+                driver or rec_driver, service, method, data.get("params"), timeout, wire_format=wire_format
+            )
+        except TimeoutError:
+            stats.add(timeout=True)
+        except MQTTRPCError:
+            stats.add(time.perf_counter() - sent, error=True)
+        except Exception:  # pylint: disable=broad-except
+            stats.add(error=True)
+        else:
+            stats.add(time.perf_counter() - sent)
+        finally:
+            slots.release()
+
+    first = None
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for record in records:
+            if record.is_reply:
+                continue
+            decoded = record.decode()
+            if decoded is None:
+                continue
+
+            if speed:
+                first = record.timestamp if first is None else first
+                delay = (record.timestamp - first) / speed - (time.perf_counter() - started)
+                if delay > 0:
+                    time.sleep(delay)
+
+            rec_driver, service, method, _, data, wire_format = decoded
+            if "id" not in data:
+                stats.notifications += 1
+                rpc_client.notify(driver or rec_driver, service, method, data.get("params"), wire_format)
+                continue
+
+            stats.requests += 1
+            slots.acquire()  # pylint: disable=consider-using-with
+            executor.submit(call, decoded)
+    stats.duration = time.perf_counter() - started
+    return stats
+
+
+def _params_key(params):
+    return json.dumps(params, sort_keys=True, default=repr)
+
+
+class TRecordedResponder:
+    """Stand-in server answering requests with recorded replies.
+
+    Replies are looked up by (service, method, params), so requests replayed
+    to another driver are answered too. Requests with no recorded reply get
+    a server error.
+
+    :param client: paho (or Loopback) client, on_message should be routed to
+        on_mqtt_message.
+    :param records: recorded traffic.
+
+    """
+
+    NO_REPLY_ERROR = {"code": -32000, "message": "No recorded reply"}
+
+    def __init__(self, client, records):
+        self.client = client
+        self.replies = {}
+        self.drivers = set()
+
+        requests = {}
+        for record in records:
+            decoded = record.decode()
+            if decoded is None:
+                continue
+            driver, service, method, _, data, _ = decoded
+            if not record.is_reply:
+                requests[_request_key(decoded)] = (service, method, _params_key(data.get("params")))
+                self.drivers.add(driver)
+                continue
+            key = requests.pop(_request_key(decoded), None)
+            if key is not None:
+                self.replies[key] = {k: v for k, v in data.items() if k in ("result", "error")}
+
+    def setup(self, drivers=None):
+        for driver in drivers or self.drivers:
+            self.client.subscribe(f"/rpc/v1/{driver}/+/+/+")
+
+    def on_mqtt_message(self, mosq, obj, msg):  # pylint: disable=unused-argument
+        decoded = Record(None, msg.topic, msg.payload).decode()
+        if decoded is None or len(msg.topic.split("/")) != 7:
+            return
+        _, service, method, _, data, wire_format = decoded
+        if "id" not in data:
+            return
+
+        key = (service, method, _params_key(data.get("params")))
+        reply = dict(self.replies.get(key, {"error": self.NO_REPLY_ERROR}))
+        reply["id"] = data["id"]
+        self.client.publish(f"{msg.topic}/reply", dumps(reply, wire_format))
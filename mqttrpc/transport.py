@@ -0,0 +1,197 @@
+"""Publishing with backpressure for MQTT-RPC clients and servers.
+
+paho queues every published message in memory until it is written to the
+socket (QoS 0) or acknowledged (QoS 1/2), with no limit by default. A fast
+producer on a slow link makes that queue grow without bound.
+
+:class:`TMQTTRPCPublisher` wraps a paho client and limits the number of such
+unconfirmed messages: publish() blocks (or raises queue.Full) when
+``max_pending`` of them are waiting, and ``queue_depth`` tells how many are,
+for callers that want to apply backpressure themselves. Messages are handed
+to paho at once, so there is no extra thread or copy on the way. Everything
+else is proxied to the wrapped client, so the publisher can be passed
+wherever a paho client is expected::
+
+    publisher = TMQTTRPCPublisher(mqtt_client, max_inflight=1000, qos=1)
+    rpc_client = TMQTTRPCClient(publisher)
+    publisher.on_message = rpc_client.on_mqtt_message
+
+Callbacks (on_message...) set on the publisher are set on the wrapped client,
+on_publish is chained. publish() never blocks on the paho network thread:
+confirmations are delivered by that thread, so replies published from
+on_message go out even above the limit.
+
+paho sends at most ``max_inflight_messages`` (20 by default) QoS 1/2 messages
+before it waits for their acknowledgements and queues the rest, so QoS 1
+throughput is capped at 20 messages per round trip to the broker.
+``max_inflight`` raises that window (and ``max_queued`` caps paho's own queue)
+through paho's public setters. paho allows that only before connect(), so
+the publisher has to be created before the client is connected.
+
+"""
+
+import queue
+import threading
+import time
+
+import paho.mqtt.client as mqtt
+
+
+class TMQTTRPCPublisher:  # pylint: disable=too-many-instance-attributes
+    """paho client wrapper with bounded number of unconfirmed messages.
+
+    :param client: paho client, not connected yet if max_inflight or
+        max_queued is given. Its on_publish is chained.
+    :param int max_pending: max number of unconfirmed messages, publish()
+        blocks above.
+    :param float ack_timeout: unconfirmed messages are forgotten after that
+        (e.g. lost on reconnect), so that they don't hold the limit forever.
+    :param int max_inflight: paho in-flight window for QoS 1/2 messages,
+        0 for unlimited. max_pending is a good value, the publisher doesn't
+        let more messages in anyway.
+    :param int max_queued: max number of messages in paho queue, publish()
+        of a message above it gives MQTT_ERR_QUEUE_SIZE.
+    :param int qos: QoS of messages published without one, e.g. by
+        TMQTTRPCClient.
+    :raises RuntimeError: max_inflight or max_queued is given for a connected client.
+
+    """
+
+    def __init__(
+        self, client, max_pending=1000, ack_timeout=10.0, max_inflight=None, max_queued=None, qos=0
+    ):  # pylint: disable=too-many-arguments,too-many-positional-arguments
+        if max_inflight is not None:
+            client.max_inflight_messages_set(max_inflight)
+        if max_queued is not None:
+            client.max_queued_messages_set(max_queued)
+
+        self.client = client
+        self.max_pending = max_pending
+        self.ack_timeout = ack_timeout
+        self.qos = qos
+
+        self._pending = {}  # mid -> time handed to paho
+        # publish() calls between the limit check and paho returning the mid
+        self._reserved = 0
+        # mids confirmed before paho returned them
+        self._early_acks = set()
+        self._lock = threading.Lock()
+        self._not_full = threading.Condition(self._lock)
+        self._drained = threading.Condition(self._lock)
+        # number of threads waiting on the conditions above, to skip notify() when there are none
+        self._waiters = 0
+        # thread delivering on_publish, covers the clients running loop() by hand
+        self._network_thread = None
+
+        self._chained_on_publish = getattr(client, "on_publish", None)
+        client.on_publish = self._on_publish
+
+    def __getattr__(self, name):
+        # called only for attributes missing here: subscribe, _client_id, loop...
+        return getattr(self.client, name)
+
+    def __setattr__(self, name, value):
+        # callbacks (on_message...) belong to the wrapped client, on_publish is chained
+        if name.startswith("on_") and not hasattr(type(self), name):
+            setattr(self.client, name, value)
+        else:
+            super().__setattr__(name, value)
+
+    @property
+    def on_publish(self):
+        return self._chained_on_publish
+
+    @on_publish.setter
+    def on_publish(self, callback):
+        self._chained_on_publish = callback
+
+    @property
+    def queue_depth(self):
+        """Number of messages handed to paho, but not confirmed yet"""
+        return len(self._pending) + self._reserved
+
+    def wait_for_drain(self, timeout=None):
+        """Wait until all messages are confirmed, return False on timeout"""
+        with self._lock:
+            self._waiters += 1
+            try:
+                return self._drained.wait_for(lambda: not self._pending and not self._reserved, timeout)
+            finally:
+                self._waiters -= 1
+
+    def publish(
+        self, topic, payload=None, qos=None, retain=False, block=True, timeout=None
+    ):  # pylint: disable=too-many-arguments,too-many-positional-arguments
+        """Publish message, waiting for free room if max_pending messages are unconfirmed.
+
+        :param int qos: the publisher's qos by default.
+        :return: paho MQTTMessageInfo.
+        :raises queue.Full: the limit is reached and block is False or timeout expired.
+
+        """
+        with self._lock:
+            if not self._on_network_thread():
+                self._wait_for_room(block, timeout)
+            self._reserved += 1
+
+        info = None
+        try:
+            info = self.client.publish(topic, payload, self.qos if qos is None else qos, retain)
+        finally:
+            with self._lock:
+                self._reserved -= 1
+                if info is not None and info.rc == mqtt.MQTT_ERR_SUCCESS:
+                    if info.mid in self._early_acks:
+                        self._early_acks.discard(info.mid)
+                    else:
+                        self._pending[info.mid] = time.monotonic()
+                if not self._reserved:
+                    # early acks left are not ours (published bypassing the wrapper)
+                    self._early_acks.clear()
+                self._notify()
+        return info
+
+    def _wait_for_room(self, block, timeout):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.queue_depth >= self.max_pending:
+            now = time.monotonic()
+            self._expire(now)
+            if self.queue_depth < self.max_pending:
+                return
+            remaining = self.ack_timeout if deadline is None else min(self.ack_timeout, deadline - now)
+            if not block or remaining <= 0:
+                raise queue.Full()
+            self._waiters += 1
+            try:
+                self._not_full.wait(remaining)
+            finally:
+                self._waiters -= 1
+
+    def _on_network_thread(self):
+        current = threading.current_thread()
+        return current is getattr(self.client, "_thread", None) or current.ident == self._network_thread
+
+    def _on_publish(self, client, userdata, mid, *args):
+        with self._lock:
+            self._network_thread = threading.get_ident()
+            if self._pending.pop(mid, None) is None and self._reserved:
+                # confirmed before publish() returned the mid
+                self._early_acks.add(mid)
+            self._notify()
+
+        if self._chained_on_publish is not None:
+            self._chained_on_publish(client, userdata, mid, *args)
+
+    def _notify(self):
+        if not self._waiters:
+            return
+        depth = self.queue_depth
+        if depth < self.max_pending:
+            self._not_full.notify()
+        if not depth:
+            self._drained.notify_all()
+
+    def _expire(self, now):
+        stale = [mid for mid, sent_at in self._pending.items() if now - sent_at > self.ack_timeout]
+        for mid in stale:
+            del self._pending[mid]
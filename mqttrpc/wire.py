@@ -0,0 +1,175 @@
+"""Wire encoding of MQTT-RPC payloads.
+
+Envelopes are serialized as JSON (the default) or MessagePack. MessagePack
+envelopes are maps, so their first byte (0x80-0x8f, 0xde or 0xdf) can't
+start a JSON document and the format is detected from the payload itself.
+The server replies in the format of the request.
+
+Compressed payloads are told apart from plain JSON by their leading magic
+bytes (zlib streams start with 0x78, zstd frames with 28 B5 2F FD), neither
+of which can start a JSON document. Peers that never compress keep sending
+and receiving plain JSON.
+
+A client that can read compressed replies lists the codecs it accepts in the
+``compression`` member of the request; the server picks the first one it
+supports too and compresses the reply if it is large enough. Servers without
+compression support reject the unknown member with Invalid Request (and null
+id), so the client sends it to a driver only once the driver has answered a
+probe request carrying it, and compresses requests only after that. A server
+that accepts the member MUST be able to decompress zlib; other codecs are
+used for requests once the server has replied with them.
+
+"""
+
+import functools
+import json
+import zlib
+
+JSON = "json"
+MSGPACK = "msgpack"
+
+ZLIB = "zlib"
+ZSTD = "zstd"
+
+DEFAULT_COMPRESSION_THRESHOLD = 1024
+
+_ZLIB_MAGIC = b"\x78"
+_ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+_MSGPACK_MAP_BYTES = frozenset(range(0x80, 0x90)) | {0xDE, 0xDF}
+
+
+@functools.lru_cache(maxsize=None)
+def _msgpack():
+    try:
+        import msgpack  # pylint: disable=import-outside-toplevel
+    except ImportError:
+        return None
+    return msgpack
+
+
+@functools.lru_cache(maxsize=None)
+def _zstandard():
+    try:
+        import zstandard  # pylint: disable=import-outside-toplevel
+    except ImportError:
+        return None
+    return zstandard
+
+
+def available_formats():
+    """Return wire formats supported by this peer."""
+    if _msgpack() is not None:
+        return [JSON, MSGPACK]
+    return [JSON]
+
+
+def detect_format(payload):
+    if isinstance(payload, (bytes, bytearray)) and payload[:1] and payload[0] in _MSGPACK_MAP_BYTES:
+        return MSGPACK
+    return JSON
+
+
+def dumps(data, wire_format=JSON):
+    """Serialize envelope. JSON gives str, MessagePack gives bytes."""
+    if wire_format == JSON:
+        return json.dumps(data)
+    if wire_format == MSGPACK and _msgpack() is not None:
+        return _msgpack().packb(data, use_bin_type=True)
+    raise ValueError(f"Unsupported wire format {wire_format}")
+
+
+def loads(payload):
+    """Deserialize (already decompressed) envelope.
+
+    :return tuple: (data, wire_format)
+    :raises ValueError: payload can't be deserialized.
+
+    """
+    wire_format = detect_format(payload)
+    if wire_format == MSGPACK:
+        if _msgpack() is None:
+            raise ValueError("Got MessagePack payload, but msgpack is not installed")
+        try:
+            return _msgpack().unpackb(payload, raw=False, strict_map_key=False), MSGPACK
+        except Exception as e:  # pylint: disable=broad-except
+            raise ValueError(f"Invalid MessagePack payload: {e}") from e
+    if isinstance(payload, (bytes, bytearray)):
+        payload = payload.decode("utf-8")
+    return json.loads(payload), JSON
+
+
+def available_compressions():
+    """Return codecs supported by this peer, most preferred first."""
+    if _zstandard() is not None:
+        return [ZSTD, ZLIB]
+    return [ZLIB]
+
+
+def choose_compression(accepted):
+    """Pick a codec for the reply from those accepted by the other side.
+
+    :param list accepted: codec names from the request, may be None.
+    :return: codec name or None if nothing suitable.
+
+    """
+    if not accepted:
+        return None
+    for codec in available_compressions():
+        if codec in accepted:
+            return codec
+    return None
+
+
+def compress(data, codec):
+    if codec == ZLIB:
+        return zlib.compress(data)
+    if codec == ZSTD and _zstandard() is not None:
+        return _zstandard().ZstdCompressor().compress(data)
+    raise ValueError(f"Unsupported compression {codec}")
+
+
+def detect_compression(payload):
+    """Return codec the payload is compressed with, None if it is not compressed."""
+    if payload[:1] == _ZLIB_MAGIC:
+        return ZLIB
+    if payload[:4] == _ZSTD_MAGIC:
+        return ZSTD
+    return None
+
+
+def decompress(payload):
+    """Return payload with compression (if any) removed.
+
+    :raises ValueError: payload is compressed, but can't be decompressed.
+
+    """
+    codec = detect_compression(payload)
+    if codec == ZLIB:
+        try:
+            return zlib.decompress(payload)
+        except zlib.error as e:
+            raise ValueError(f"Invalid zlib payload: {e}") from e
+    if codec == ZSTD:
+        if _zstandard() is None:
+            raise ValueError("Got zstd payload, but zstandard is not installed")
+        try:
+            return _zstandard().ZstdDecompressor().decompress(payload)
+        except _zstandard().ZstdError as e:
+            raise ValueError(f"Invalid zstd payload: {e}") from e
+    return payload
+
+
+def encode_payload(payload, compression=None, threshold=DEFAULT_COMPRESSION_THRESHOLD):
+    """Prepare serialized message for publishing.
+
+    Payload is compressed only if a codec is given, it is at least
+    ``threshold`` bytes long and compression actually makes it smaller.
+
+    """
+    if isinstance(payload, str):
+        payload = payload.encode("utf-8")
+    if compression is not None and len(payload) >= threshold:
+        compressed = compress(payload, compression)
+        if len(compressed) < len(payload):
+            return compressed
+    return payload
@@ -9,6 +9,7 @@ except ImportError:
 import logging
 
 from mqttrpc import MQTTRPCResponseManager, dispatcher
+from mqttrpc.dedup import MQTTRPCDedupTable
 
 logging.getLogger().setLevel(logging.DEBUG)
 
@@ -22,6 +23,7 @@ class TMQTTRPCServer:
     def __init__(self, client, driver_id):  # pylint: disable=redefined-outer-name
         self.client = client
         self.driver_id = driver_id
+        self.dedup = MQTTRPCDedupTable()
 
     def on_mqtt_message(self, mosq, obj, msg):  # pylint: disable=unused-argument
         print(msg.topic)
@@ -32,10 +34,15 @@ class TMQTTRPCServer:
         method_id = parts[5]
         client_id = parts[6]
 
-        response = MQTTRPCResponseManager.handle(msg.payload, service_id, method_id, dispatcher)
+        response = MQTTRPCResponseManager.handle(
+            msg.payload, service_id, method_id, dispatcher, client_id=client_id, dedup=self.dedup
+        )
+        if not response:
+            # notification, nobody waits for the reply
+            return
 
         self.client.publish(
-            f"/rpc/v1/{self.driver_id}/{service_id}/{method_id}/{client_id}/reply", response.json
+            f"/rpc/v1/{self.driver_id}/{service_id}/{method_id}/{client_id}/reply", response.payload
         )
 
     def setup(self):
@@ -52,4 +52,8 @@ setup(
         "paho-mqtt==2.1.0",
         "wb-common @ git+https://github.com/wirenboard/wb-common.git@master",
     ],
+    extras_require={
+        "msgpack": ["msgpack"],
+        "zstd": ["zstandard"],
+    },
 )
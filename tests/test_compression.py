@@ -0,0 +1,134 @@
+import json
+
+import pytest
+
+from mqttrpc.client import TimeoutError, TMQTTRPCClient  # pylint: disable=redefined-builtin
+from mqttrpc.dispatcher import Dispatcher
+from mqttrpc.loopback import LoopbackBroker
+from mqttrpc.manager import MQTTRPCResponseManager
+from mqttrpc.wire import ZLIB, decompress, detect_compression
+
+INVALID_REQUEST = {"id": None, "error": {"code": -32600, "message": "Invalid Request"}}
+
+
+class TServer:  # pylint: disable=too-few-public-methods
+    """Echo server, either current or baseline-style rejecting unknown members"""
+
+    def __init__(self, broker, driver):
+        self.supports_compression = True
+        self.requests = []
+        self.dispatcher = Dispatcher()
+        self.dispatcher[("test", "echo")] = lambda value: value
+        self.client = broker.client(driver)
+        self.client.on_message = self.on_mqtt_message
+        self.client.subscribe(f"/rpc/v1/{driver}/+/+/+")
+        self.client.loop_start()
+
+    def on_mqtt_message(self, mosq, obj, msg):  # pylint: disable=unused-argument
+        data = json.loads(decompress(msg.payload))
+        self.requests.append((detect_compression(msg.payload), data))
+        if not self.supports_compression and "compression" in data:
+            self.client.publish(f"{msg.topic}/reply", json.dumps(INVALID_REQUEST))
+            return
+        parts = msg.topic.split("/")
+        response = MQTTRPCResponseManager.handle(msg.payload, parts[4], parts[5], self.dispatcher)
+        self.client.publish(f"{msg.topic}/reply", response.payload)
+
+
+@pytest.fixture(name="broker")
+def fixture_broker():
+    return LoopbackBroker()
+
+
+@pytest.fixture(name="server")
+def fixture_server(broker):
+    server = TServer(broker, "driver")
+    yield server
+    server.client.disconnect()
+
+
+def make_client(broker, **kwargs):
+    client = broker.client("client")
+    rpc_client = TMQTTRPCClient(client, compression_threshold=100, **kwargs)
+    client.on_message = rpc_client.on_mqtt_message
+    client.loop_start()
+    return rpc_client
+
+
+def call(rpc_client, size=500):
+    return rpc_client.call("driver", "test", "echo", {"value": "x" * size}, 5)
+
+
+def test_probe_rejected_and_resent_plain(broker, server):
+    server.supports_compression = False
+    rpc_client = make_client(broker, compression=ZLIB)
+
+    assert call(rpc_client) == "x" * 500
+    assert call(rpc_client) == "x" * 500
+
+    assert rpc_client.driver_compression == {"driver": None}
+    probe, resent, plain = server.requests
+    assert probe == (None, {"params": {"value": "x" * 500}, "id": 1, "compression": [ZLIB]})
+    assert resent == (None, {"params": {"value": "x" * 500}, "id": 1})
+    assert plain == (None, {"params": {"value": "x" * 500}, "id": 2})
+
+
+def test_supported_compression(broker, server):
+    rpc_client = make_client(broker, compression=ZLIB)
+
+    assert call(rpc_client) == "x" * 500
+    assert call(rpc_client) == "x" * 500
+    assert call(rpc_client, 10) == "x" * 10
+
+    assert rpc_client.driver_compression == {"driver": ZLIB}
+    (probe_codec, probe), (codec, request), (small_codec, small) = server.requests
+    # the probe is never compressed, the server may not read it
+    assert probe_codec is None and probe["compression"] == [ZLIB]
+    assert codec == ZLIB and request["compression"] == [ZLIB]
+    assert small_codec is None and small["compression"] == [ZLIB]
+
+
+def test_requests_use_zlib_until_server_replies_with_zstd(broker, server):
+    pytest.importorskip("zstandard")
+    rpc_client = make_client(broker, compression="zstd")
+
+    call(rpc_client, 10)
+    call(rpc_client)
+    assert server.requests[-1][0] == ZLIB
+
+    call(rpc_client, 5000)  # compressed reply
+    call(rpc_client)
+    assert server.requests[-1][0] == "zstd"
+
+
+def test_reset_when_driver_stops_supporting_compression(broker, server):
+    rpc_client = make_client(broker, compression=ZLIB)
+    call(rpc_client)
+    assert rpc_client.driver_compression == {"driver": ZLIB}
+
+    server.supports_compression = False
+    with pytest.raises(TimeoutError):
+        rpc_client.call("driver", "test", "echo", {"value": "lost"}, 0.1)
+    assert not rpc_client.driver_compression
+
+    assert call(rpc_client) == "x" * 500
+    assert rpc_client.driver_compression == {"driver": None}
+    assert "compression" not in server.requests[-1][1]
+
+
+def test_unsupported_codec():
+    with pytest.raises(ValueError):
+        TMQTTRPCClient(LoopbackBroker().client("client"), compression="lz4")
+
+
+def test_failed_encoding_registers_nothing(broker):
+    pending = []
+    rpc_client = make_client(broker, compression=ZLIB, on_pending=pending.append)
+
+    with pytest.raises(TypeError):
+        rpc_client.call_async("driver", "test", "echo", {"value": object()})
+
+    assert not rpc_client.futures
+    assert not rpc_client._compression_probes  # pylint: disable=protected-access
+    assert not pending
+    assert rpc_client.counter == 0
@@ -0,0 +1,123 @@
+import asyncio
+import json
+import threading
+import time
+
+from mqttrpc import AMQTTRPCResponseManager, MQTTRPCResponseManager
+from mqttrpc.dedup import MQTTRPCDedupTable
+from mqttrpc.dispatcher import Dispatcher
+
+
+def test_running_entry_outlives_expired_ones():
+    table = MQTTRPCDedupTable(maxsize=4, ttl=0.01)
+    running, _ = table.acquire("fw")
+    for i in range(10):
+        entry, _ = table.acquire(i)
+        table.complete(i, entry, f"response {i}")
+    time.sleep(0.02)
+
+    table.acquire("next")
+
+    entry, is_new = table.acquire("fw")
+    assert entry is running
+    assert not is_new
+    assert len(table) == 2
+
+
+def test_maxsize_drops_oldest_completed():
+    table = MQTTRPCDedupTable(maxsize=2, ttl=60)
+    running, _ = table.acquire("fw")
+    for i in range(5):
+        entry, _ = table.acquire(i)
+        table.complete(i, entry, i)
+
+    assert [table.acquire(i)[1] for i in (3, 4)] == [False, False]
+    assert table.acquire(0)[1]
+    assert table.acquire("fw") == (running, False)
+
+
+def test_duplicate_gets_cached_payload():
+    calls = []
+    dispatcher = Dispatcher()
+    dispatcher[("fw", "write")] = lambda: calls.append(1) or "ok"
+    table = MQTTRPCDedupTable()
+    request = json.dumps({"params": {}, "id": 1})
+
+    first = MQTTRPCResponseManager.handle(request, "fw", "write", dispatcher, "client", table)
+    payload = first.payload
+    second = MQTTRPCResponseManager.handle(request, "fw", "write", dispatcher, "client", table)
+
+    assert calls == [1]
+    assert second.payload is payload
+
+
+def test_same_id_different_request():
+    dispatcher = Dispatcher()
+    dispatcher[("fw", "write")] = lambda value: value
+    table = MQTTRPCDedupTable()
+
+    def handle(value):
+        request = json.dumps({"params": {"value": value}, "id": 1})
+        return MQTTRPCResponseManager.handle(request, "fw", "write", dispatcher, "client", table)
+
+    first = handle("a")
+    second = handle("b")
+    assert (first.result, second.result) == ("a", "b")
+    assert handle("b") is second
+
+
+def test_same_key_while_running():
+    table = MQTTRPCDedupTable()
+    running, _ = table.acquire("k", table.digest(b"first"))
+
+    other, is_new = table.acquire("k", table.digest(b"second"))
+    assert is_new and other is not running
+    table.complete("k", other, "second")
+
+    assert table.acquire("k", table.digest(b"first")) == (running, False)
+    assert len(table) == 1
+
+
+def test_duplicate_wait_is_bounded():
+    release = threading.Event()
+    dispatcher = Dispatcher()
+    dispatcher[("fw", "write")] = lambda: release.wait(5) and "ok"
+    table = MQTTRPCDedupTable(wait_timeout=0.05)
+    request = json.dumps({"params": {}, "id": 1})
+    first = threading.Thread(
+        target=MQTTRPCResponseManager.handle, args=(request, "fw", "write", dispatcher, "client", table)
+    )
+    first.start()
+    time.sleep(0.01)
+
+    assert not MQTTRPCResponseManager.handle(request, "fw", "write", dispatcher, "client", table)
+
+    release.set()
+    first.join()
+
+
+def test_async_duplicate_attaches_to_running():
+    calls = []
+    dispatcher = Dispatcher()
+
+    async def write():
+        calls.append(1)
+        await asyncio.sleep(0.02)
+        return "ok"
+
+    dispatcher[("fw", "write")] = write
+    table = MQTTRPCDedupTable()
+    request = json.dumps({"params": {}, "id": 1})
+
+    async def run():
+        return await asyncio.gather(
+            *(
+                AMQTTRPCResponseManager.handle(request, "fw", "write", dispatcher, "client", table)
+                for _ in range(3)
+            )
+        )
+
+    responses = asyncio.run(run())
+
+    assert calls == [1]
+    assert [response.result for response in responses] == ["ok"] * 3
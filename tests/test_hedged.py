@@ -0,0 +1,69 @@
+import time
+
+import pytest
+
+from mqttrpc import MQTTRPCResponseManager
+from mqttrpc.client import MQTTRPCError, TMQTTRPCClient
+from mqttrpc.dispatcher import Dispatcher
+from mqttrpc.loopback import LoopbackBroker
+
+
+def failing():
+    raise RuntimeError("down")
+
+
+def slow():
+    time.sleep(0.02)
+    return "ok"
+
+
+@pytest.fixture(name="rpc_client")
+def fixture_rpc_client():
+    broker = LoopbackBroker()
+    servers = []
+    for driver, method in (("broken", failing), ("healthy", slow)):
+        dispatcher = Dispatcher()
+        dispatcher[("test", "read")] = method
+        server = broker.client(driver)
+
+        def on_message(mosq, obj, msg, dispatcher=dispatcher):  # pylint: disable=unused-argument
+            parts = msg.topic.split("/")
+            response = MQTTRPCResponseManager.handle(msg.payload, parts[4], parts[5], dispatcher)
+            mosq.publish(f"{msg.topic}/reply", response.payload)
+
+        server.on_message = on_message
+        server.subscribe(f"/rpc/v1/{driver}/+/+/+")
+        server.loop_start()
+        servers.append(server)
+
+    client = broker.client("client")
+    rpc_client = TMQTTRPCClient(client)
+    client.on_message = rpc_client.on_mqtt_message
+    client.loop_start()
+    yield rpc_client
+    for mqtt_client in servers + [client]:
+        mqtt_client.disconnect()
+
+
+def test_failing_driver_is_not_primary(rpc_client):
+    with pytest.raises(MQTTRPCError):
+        rpc_client.call("broken", "test", "read", {}, 5)
+    assert rpc_client.call_hedged(["broken", "healthy"], "test", "read", {}, timeout=5) == "ok"
+
+    sent = []
+    publish = rpc_client.client.publish
+    rpc_client.client.publish = lambda topic, *args, **kwargs: sent.append(topic) or publish(
+        topic, *args, **kwargs
+    )
+    for _ in range(5):
+        # no hedging, only the choice of the primary driver is checked
+        assert rpc_client.call_hedged(["broken", "healthy"], "test", "read", {}, 5, hedge_delay=5) == "ok"
+
+    assert all(topic.startswith("/rpc/v1/healthy/") for topic in sent)
+    assert rpc_client.driver_error_rate("broken") == 1.0
+    assert rpc_client.driver_latency("broken") is None
+
+
+def test_all_drivers_failed(rpc_client):
+    with pytest.raises(MQTTRPCError):
+        rpc_client.call_hedged(["broken"], "test", "read", {}, timeout=5)
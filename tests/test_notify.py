@@ -0,0 +1,76 @@
+import json
+import queue
+
+import pytest
+
+from mqttrpc import MQTTRPCResponseManager
+from mqttrpc.client import TMQTTRPCClient
+from mqttrpc.dispatcher import Dispatcher
+from mqttrpc.loopback import LoopbackBroker
+
+
+@pytest.fixture(name="broker")
+def fixture_broker():
+    return LoopbackBroker()
+
+
+@pytest.fixture(name="commands")
+def fixture_commands(broker):
+    commands = queue.SimpleQueue()
+    dispatcher = Dispatcher()
+    dispatcher[("test", "echo")] = lambda value: value
+    dispatcher[("test", "set")] = lambda value: commands.put(value)  # pylint: disable=unnecessary-lambda
+    server = broker.client("server")
+
+    def on_message(mosq, obj, msg):  # pylint: disable=unused-argument
+        parts = msg.topic.split("/")
+        response = MQTTRPCResponseManager.handle(msg.payload, parts[4], parts[5], dispatcher)
+        if not response:
+            # notification, nobody waits for the reply
+            return
+        server.publish(f"{msg.topic}/reply", response.payload)
+
+    server.on_message = on_message
+    server.subscribe("/rpc/v1/driver/+/+/+")
+    server.loop_start()
+    yield commands
+    server.disconnect()
+
+
+@pytest.fixture(name="published")
+def fixture_published(broker):
+    published = queue.SimpleQueue()
+    spy = broker.client("spy")
+    spy.on_message = lambda mosq, obj, msg: published.put((msg.topic, json.loads(msg.payload)))
+    spy.subscribe("/rpc/v1/#")
+    spy.loop_start()
+    yield published
+    spy.disconnect()
+
+
+@pytest.fixture(name="rpc_client")
+def fixture_rpc_client(broker):
+    client = broker.client("client")
+    rpc_client = TMQTTRPCClient(client)
+    client.on_message = rpc_client.on_mqtt_message
+    client.loop_start()
+    yield rpc_client
+    client.disconnect()
+
+
+def test_notify(rpc_client, commands, published):
+    rpc_client.notify("driver", "test", "set", {"value": 1})
+
+    assert commands.get(timeout=5) == 1
+    assert not rpc_client.futures
+    assert not rpc_client.subscribes
+    assert rpc_client.counter == 0
+
+    # the server handles requests in order, a reply to the notification would come before this one
+    assert rpc_client.call("driver", "test", "echo", {"value": 2}, 5) == 2
+    assert [published.get(timeout=5) for _ in range(3)] == [
+        ("/rpc/v1/driver/test/set/client", {"params": {"value": 1}}),
+        ("/rpc/v1/driver/test/echo/client", {"params": {"value": 2}, "id": 1}),
+        ("/rpc/v1/driver/test/echo/client/reply", {"result": 2, "error": None, "id": 1}),
+    ]
+    assert published.empty()
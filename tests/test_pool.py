@@ -0,0 +1,74 @@
+import pytest
+
+from mqttrpc import MQTTRPCResponseManager
+from mqttrpc.client import TimeoutError  # pylint: disable=redefined-builtin
+from mqttrpc.dispatcher import Dispatcher
+from mqttrpc.loopback import LoopbackBroker
+from mqttrpc.pool import TMQTTRPCClientPool
+
+
+@pytest.fixture(name="broker")
+def fixture_broker():
+    broker = LoopbackBroker()
+    dispatcher = Dispatcher()
+    dispatcher[("test", "echo")] = lambda value: value
+    server = broker.client("server")
+
+    def on_message(mosq, obj, msg):  # pylint: disable=unused-argument
+        parts = msg.topic.split("/")
+        response = MQTTRPCResponseManager.handle(msg.payload, parts[4], parts[5], dispatcher)
+        if response:
+            server.publish(f"{msg.topic}/reply", response.payload)
+
+    server.on_message = on_message
+    server.subscribe("/rpc/v1/driver/+/+/+")
+    server.loop_start()
+    yield broker
+    server.disconnect()
+
+
+@pytest.fixture(name="pool")
+def fixture_pool(broker):
+    connections = [broker.client(f"pool-{i}") for i in range(3)]
+    pool = TMQTTRPCClientPool(connections)
+    for connection in connections:
+        connection.on_message = pool.on_mqtt_message
+        connection.loop_start()
+    yield pool
+    for connection in connections:
+        connection.disconnect()
+
+
+def test_calls(pool):
+    first, second = pool.create_client("first"), pool.create_client("second")
+
+    assert [first.call("driver", "test", "echo", {"value": i}, 5) for i in range(6)] == list(range(6))
+    assert second.call("driver", "test", "echo", {"value": "x"}, 5) == "x"
+    assert pool.pending() == [0, 0, 0]
+
+
+def test_timed_out_calls_are_not_pending(pool):
+    rpc_client = pool.create_client()
+
+    with pytest.raises(TimeoutError):
+        rpc_client.call("missing", "test", "echo", {"value": 1}, 0.05)
+    assert pool.pending() == [0, 0, 0]
+
+
+def test_idle_connections_taken_in_turn(pool):
+    assert sorted(pool.pick() for _ in range(3)) == [0, 1, 2]
+
+
+def test_busy_connection_avoided(pool):
+    rpc_client = pool.create_client()
+    for client in rpc_client.clients[:2]:
+        client.call_async("missing", "test", "echo", {"value": 1})
+
+    assert pool.pending() == [1, 1, 0]
+    assert {pool.pick() for _ in range(3)} == {2}
+
+
+def test_duplicate_name(pool):
+    pool.create_client("name")
+    with pytest.raises(ValueError):
+        pool.create_client("name")
@@ -0,0 +1,154 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from mqttrpc.client import TMQTTRPCClient
+from mqttrpc.loopback import LoopbackBroker
+from mqttrpc.traffic import (
+    FILE_HEADER,
+    TrafficRecorder,
+    TRecordedResponder,
+    analyze,
+    read_records,
+    replay,
+)
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+TRAFFIC = [
+    (10.0, "/rpc/v1/driver/test/get/client", {"params": {"channel": 1}, "id": 1}),
+    (10.5, "/rpc/v1/driver/test/set/client", {"params": {"channel": 1, "value": 2}}),
+    (11.0, "/rpc/v1/driver/test/get/client/reply", {"result": 100, "error": None, "id": 1}),
+    (11.5, "/rpc/v1/driver/test/get/client", {"params": {"channel": 9}, "id": 2}),
+    (
+        11.75,
+        "/rpc/v1/driver/test/get/client/reply",
+        {"error": {"code": -32000, "message": "No channel"}, "id": 2},
+    ),
+    # never replied
+    (12.0, "/rpc/v1/driver/test/get/client", {"params": {"channel": 3}, "id": 3}),
+]
+
+
+@pytest.fixture(name="recording")
+def fixture_recording(tmp_path):
+    path = str(tmp_path / "traffic.bin")
+    with TrafficRecorder(path) as recorder:
+        for timestamp, topic, data in TRAFFIC:
+            recorder.record(topic, json.dumps(data), timestamp)
+    return path
+
+
+def test_round_trip(recording):
+    records = list(read_records(recording))
+
+    assert [(r.timestamp, r.topic, json.loads(r.payload)) for r in records] == TRAFFIC
+    assert [r.is_reply for r in records] == [False, False, True, False, True, False]
+
+
+def test_truncated_last_record(recording):
+    with open(recording, "rb") as f:
+        data = f.read()
+    with open(recording, "wb") as f:
+        f.write(data[:-5])
+
+    records = list(read_records(recording))
+
+    assert [(r.timestamp, r.topic) for r in records] == [(t, topic) for t, topic, _ in TRAFFIC[:-1]]
+
+
+def test_bad_header(tmp_path):
+    path = tmp_path / "traffic.bin"
+    path.write_bytes(b"not a recording" + FILE_HEADER)
+
+    with pytest.raises(ValueError):
+        list(read_records(str(path)))
+
+
+def test_live_recording(tmp_path):
+    broker = LoopbackBroker()
+    path = str(tmp_path / "traffic.bin")
+    with TrafficRecorder(path) as recorder:
+        listener = broker.client("recorder")
+        listener.on_message = recorder.on_mqtt_message
+        recorder.subscribe(listener)
+        listener.loop_start()
+
+        client = broker.client("client")
+        client.publish("/rpc/v1/driver/test/get/client", json.dumps(TRAFFIC[0][2]))
+        client.publish("/rpc/v1/driver/test/get/client/reply", json.dumps(TRAFFIC[2][2]))
+        client.publish("/devices/driver/controls/value", "1")
+        listener.loop_stop()
+
+    assert [r.topic for r in read_records(path)] == [TRAFFIC[0][1], TRAFFIC[2][1]]
+
+
+def test_analyze(recording):
+    report = analyze(read_records(recording)).report()
+
+    assert report["requests"] == 3
+    assert report["notifications"] == 1
+    assert (report["errors"], report["timeouts"]) == (1, 1)
+    assert report["duration"] == 2.0
+    assert (report["latency"]["p50"], report["latency"]["p99"]) == (0.25, 1.0)
+
+
+@pytest.mark.parametrize("driver", [None, "other"])
+def test_replay(recording, driver):
+    records = list(read_records(recording))
+    broker = LoopbackBroker()
+
+    server = broker.client("responder")
+    responder = TRecordedResponder(server, records)
+    server.on_message = responder.on_mqtt_message
+    server.loop_start()
+    responder.setup([driver] if driver else None)
+
+    notifications = []
+    spy = broker.client("spy")
+    spy.on_message = lambda mosq, obj, msg: notifications.append(msg.topic)
+    spy.subscribe("/rpc/v1/+/test/set/+")
+    spy.loop_start()
+
+    client = broker.client("client")
+    rpc_client = TMQTTRPCClient(client)
+    client.on_message = rpc_client.on_mqtt_message
+    client.loop_start()
+    try:
+        report = replay(records, rpc_client, speed=None, timeout=1, driver=driver).report()
+    finally:
+        for mqtt_client in (client, server, spy):
+            mqtt_client.disconnect()
+
+    assert (report["requests"], report["notifications"]) == (3, 1)
+    # recorded error and the request with no recorded reply
+    assert (report["errors"], report["timeouts"]) == (2, 0)
+    assert notifications == [f"/rpc/v1/{driver or 'driver'}/test/set/{rpc_client.rpc_client_id}"]
+
+
+def run_tool(*args):
+    pytest.importorskip("wb_common")
+    return subprocess.run(
+        [sys.executable, os.path.join(ROOT, "bin", "mqtt-rpc-traffic"), *args],
+        capture_output=True,
+        check=True,
+        env=dict(os.environ, PYTHONPATH=ROOT),
+        text=True,
+    ).stdout
+
+
+def test_tool_analyze(recording):
+    report = json.loads(run_tool("analyze", "-i", recording))
+
+    assert (report["requests"], report["notifications"], report["timeouts"]) == (3, 1, 1)
+
+
+def test_tool_loopback_replay(recording):
+    report = json.loads(
+        run_tool("replay", "-i", recording, "--loopback", "-d", "other", "-s", "0", "-t", "1")
+    )
+
+    assert (report["requests"], report["errors"], report["timeouts"]) == (3, 2, 0)
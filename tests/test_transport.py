@@ -0,0 +1,142 @@
+import itertools
+import queue
+import threading
+
+import paho.mqtt.client as mqtt
+import pytest
+
+from mqttrpc.client import TMQTTRPCClient
+from mqttrpc.loopback import LoopbackMessageInfo
+from mqttrpc.transport import TMQTTRPCPublisher
+
+
+class SlowLinkClient:
+    """paho-like client confirming messages only when told to"""
+
+    def __init__(self):
+        self._client_id = b"slow"
+        self._thread = None
+        self._mids = itertools.count(1)
+        self.on_publish = None
+        self.on_message = None
+        self.sent = []
+        self.qos = None
+
+    def publish(self, topic, payload=None, qos=0, retain=False):  # pylint: disable=unused-argument
+        mid = next(self._mids)
+        self.sent.append(mid)
+        self.qos = qos
+        return LoopbackMessageInfo(mid)
+
+    def confirm(self):
+        mid = self.sent.pop(0)
+        self.on_publish(self, None, mid, None, None)  # pylint: disable=not-callable
+
+
+def test_returns_message_info():
+    client = SlowLinkClient()
+    publisher = TMQTTRPCPublisher(client)
+
+    info = publisher.publish("/a", "1")
+
+    assert info.rc == mqtt.MQTT_ERR_SUCCESS
+    assert info.mid == 1
+    assert publisher.queue_depth == 1
+    client.confirm()
+    assert publisher.queue_depth == 0
+    assert publisher.wait_for_drain(0)
+
+
+def test_notify_returns_message_info():
+    publisher = TMQTTRPCPublisher(SlowLinkClient())
+    rpc_client = TMQTTRPCClient(publisher)
+
+    info = rpc_client.notify("driver", "service", "method", {})
+
+    assert info.rc == mqtt.MQTT_ERR_SUCCESS
+    assert publisher.queue_depth == 1
+
+
+def test_full():
+    client = SlowLinkClient()
+    publisher = TMQTTRPCPublisher(client, max_pending=2)
+    publisher.publish("/a", "1")
+    publisher.publish("/a", "2")
+
+    with pytest.raises(queue.Full):
+        publisher.publish("/a", "3", block=False)
+    with pytest.raises(queue.Full):
+        publisher.publish("/a", "3", timeout=0.01)
+
+    client.confirm()
+    publisher.publish("/a", "3", block=False)
+    assert publisher.queue_depth == 2
+
+
+def test_blocked_publish_resumes_on_confirmation():
+    client = SlowLinkClient()
+    publisher = TMQTTRPCPublisher(client, max_pending=1)
+    publisher.publish("/a", "1")
+    published = threading.Event()
+    thread = threading.Thread(target=lambda: publisher.publish("/a", "2") and published.set())
+    thread.start()
+
+    assert not published.wait(0.05)
+    client.confirm()
+    assert published.wait(5)
+    thread.join()
+
+
+def test_network_thread_is_not_blocked():
+    client = SlowLinkClient()
+    publisher = TMQTTRPCPublisher(client, max_pending=1)
+    publisher.publish("/a", "1")
+    client._thread = threading.current_thread()  # pylint: disable=protected-access
+
+    publisher.publish("/a", "reply", block=False)
+
+    assert publisher.queue_depth == 2
+
+
+def test_lost_messages_expire():
+    client = SlowLinkClient()
+    publisher = TMQTTRPCPublisher(client, max_pending=1, ack_timeout=0.01)
+    publisher.publish("/a", "1")
+
+    publisher.publish("/a", "2", timeout=1)
+
+    assert publisher.queue_depth == 1
+
+
+def test_callbacks_are_set_on_client():
+    client = SlowLinkClient()
+    publisher = TMQTTRPCPublisher(client)
+    confirmed = []
+
+    publisher.on_message = print
+    publisher.on_publish = lambda client, userdata, mid, *args: confirmed.append(mid)
+    publisher.publish("/a", "1")
+    client.confirm()
+
+    assert client.on_message is print
+    assert confirmed == [1]
+    assert publisher.queue_depth == 0
+
+
+def test_default_qos():
+    client = SlowLinkClient()
+    publisher = TMQTTRPCPublisher(client, qos=1)
+    rpc_client = TMQTTRPCClient(publisher)
+
+    rpc_client.notify("driver", "service", "method", {})
+    assert client.qos == 1
+    publisher.publish("/a", "1", qos=0)
+    assert client.qos == 0
+
+
+def test_paho_limits():
+    client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, "test")
+
+    TMQTTRPCPublisher(client, max_inflight=500, max_queued=2000)
+
+    assert (client.max_inflight_messages, client.max_queued_messages) == (500, 2000)
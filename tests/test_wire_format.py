@@ -0,0 +1,148 @@
+import json
+
+import pytest
+
+from mqttrpc import MQTTRPCResponseManager
+from mqttrpc.client import TMQTTRPCClient
+from mqttrpc.dispatcher import Dispatcher
+from mqttrpc.loopback import LoopbackBroker
+from mqttrpc.wire import JSON, MSGPACK, ZLIB, compress, decompress, detect_format, dumps, loads
+
+msgpack = pytest.importorskip("msgpack")
+
+
+@pytest.fixture(name="dispatcher")
+def fixture_dispatcher():
+    dispatcher = Dispatcher()
+    dispatcher[("test", "echo")] = lambda value: value
+    dispatcher[("test", "registers")] = lambda count: list(range(count))
+    dispatcher[("test", "blob")] = lambda size: bytes(range(256)) * (size // 256)
+    dispatcher[("test", "map")] = lambda: {1: 100, 2: 200}
+    return dispatcher
+
+
+def handle(dispatcher, payload, method="echo"):
+    response = MQTTRPCResponseManager.handle(payload, "test", method, dispatcher)
+    return loads(decompress(response.payload))
+
+
+@pytest.mark.parametrize("wire_format", [JSON, MSGPACK])
+def test_round_trip(dispatcher, wire_format):
+    payload = dumps({"params": {"value": {"a": [1, 2.5, "x", None]}}, "id": 1}, wire_format)
+
+    data, reply_format = handle(dispatcher, payload)
+
+    assert reply_format == wire_format
+    assert (data["id"], data["result"]) == (1, {"a": [1, 2.5, "x", None]})
+
+
+def test_msgpack_register_array(dispatcher):
+    payload = msgpack.packb({"params": {"count": 1000}, "id": 7})
+
+    data, reply_format = handle(dispatcher, payload, "registers")
+
+    assert reply_format == MSGPACK
+    assert (data["id"], data["result"]) == (7, list(range(1000)))
+
+
+def test_msgpack_bytes_result(dispatcher):
+    payload = msgpack.packb({"params": {"size": 1024}, "id": 2})
+
+    response = MQTTRPCResponseManager.handle(payload, "test", "blob", dispatcher)
+    data = msgpack.unpackb(response.payload, raw=False)
+
+    # raw bin type, no base64
+    assert data["result"] == bytes(range(256)) * 4
+    assert len(response.payload) < 1024 + 32
+
+
+def test_msgpack_bytes_params(dispatcher):
+    payload = msgpack.packb({"params": {"value": b"\x00\xff\x10"}, "id": 3})
+
+    data, _ = handle(dispatcher, payload)
+
+    assert data["result"] == b"\x00\xff\x10"
+
+
+def test_msgpack_integer_keys(dispatcher):
+    data, _ = handle(dispatcher, msgpack.packb({"params": [{1: 2}], "id": 6}))
+    assert data["result"] == {1: 2}
+
+    data, _ = handle(dispatcher, msgpack.packb({"params": [], "id": 6}), "map")
+    assert data["result"] == {1: 100, 2: 200}
+
+
+def test_msgpack_error(dispatcher):
+    payload = msgpack.packb({"params": {}, "id": 4})
+
+    data, reply_format = handle(dispatcher, payload, "missing")
+
+    assert reply_format == MSGPACK
+    assert data["id"] == 4
+    assert data["error"]["code"] == -32601
+
+
+def test_msgpack_invalid_request(dispatcher):
+    payload = msgpack.packb({"params": {}, "id": 5, "unknown": 1})
+
+    data, reply_format = handle(dispatcher, payload)
+
+    assert reply_format == MSGPACK
+    assert data["id"] is None
+    assert data["error"]["code"] == -32600
+
+
+def test_compressed_msgpack_request(dispatcher):
+    payload = compress(msgpack.packb({"params": {"value": "x" * 4096}, "id": 6}), ZLIB)
+    assert detect_format(decompress(payload)) == MSGPACK
+
+    data, reply_format = handle(dispatcher, payload)
+
+    assert reply_format == MSGPACK
+    assert (data["id"], data["result"]) == (6, "x" * 4096)
+
+
+def test_compressed_msgpack_response(dispatcher):
+    payload = msgpack.packb({"params": {"value": "x" * 4096}, "id": 8, "compression": [ZLIB]})
+
+    response = MQTTRPCResponseManager.handle(payload, "test", "echo", dispatcher)
+
+    assert response.payload[:1] == b"\x78"
+    assert detect_format(decompress(response.payload)) == MSGPACK
+    data, _ = loads(decompress(response.payload))
+    assert (data["id"], data["result"]) == (8, "x" * 4096)
+
+
+def test_json_stays_default(dispatcher):
+    payload = json.dumps({"params": {"value": 1}, "id": 9})
+
+    response = MQTTRPCResponseManager.handle(payload, "test", "echo", dispatcher)
+
+    assert response.wire_format == JSON
+    assert json.loads(response.payload)["result"] == 1
+
+
+def test_client_msgpack_call(dispatcher):
+    broker = LoopbackBroker()
+    server = broker.client("server")
+
+    def on_message(mosq, obj, msg):  # pylint: disable=unused-argument
+        parts = msg.topic.split("/")
+        response = MQTTRPCResponseManager.handle(msg.payload, parts[4], parts[5], dispatcher)
+        server.publish(f"{msg.topic}/reply", response.payload)
+
+    server.on_message = on_message
+    server.subscribe("/rpc/v1/driver/+/+/+")
+    server.loop_start()
+
+    client = broker.client("client")
+    rpc_client = TMQTTRPCClient(client, wire_format=MSGPACK)
+    client.on_message = rpc_client.on_mqtt_message
+    client.loop_start()
+    try:
+        assert rpc_client.call("driver", "test", "blob", {"size": 512}, 5) == bytes(range(256)) * 2
+        assert rpc_client.call("driver", "test", "map", [], 5) == {1: 100, 2: 200}
+        assert rpc_client.call("driver", "test", "echo", {"value": [1, 2]}, 5, wire_format=JSON) == [1, 2]
+    finally:
+        client.disconnect()
+        server.disconnect()